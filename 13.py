@@ -1,11 +1,18 @@
-import requests
-import json
 import pandas as pd
 import os
 import time
 import logging
+import itertools
 from datetime import datetime
-from pathlib import Path
+import ted_http
+from ted_sink import ParquetSink, SqliteSink
+from ted_cache import SearchCache
+from ted_state import WatermarkStore, IncrementalCrawl, CrawlCheckpoint, ChangeIndex
+from ted_schema import OutputSchema, lot_key
+from ted_fields import Field, AnyOf, FIRST, TEXT_FIRST_ITEM, TEXT_PREFERRED, TEXT_PRESENT, compile_fields
+import ted_table
+from ted_search import (plan_shards, crawl_shards, NoticeClaims, Paginator, PAGINATION_AUTO,
+                        stream_search_response, lookup_notices, pagination_mode, cache_payload)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,9 +27,100 @@ logger = logging.getLogger('ted_crawler')
 OUTPUT_DIR = 'data'
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'ted_api_tenders_full13.csv')
 CACHE_DIR = os.path.join(OUTPUT_DIR, 'cache')
+CACHE_TTL = 6 * 3600  # 搜索页缓存有效期（秒）
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # 搜索页缓存总大小上限
+PARQUET_DIR = os.path.join(OUTPUT_DIR, 'parquet13')  # 按发布日期分区的列式输出
+WATERMARK_FILE = os.path.join(OUTPUT_DIR, 'watermarks13.json')  # 增量模式的水位线
+CHECKPOINT_FILE = os.path.join(OUTPUT_DIR, 'checkpoint13.jsonl')  # 断点续爬日志
+CHANGE_INDEX_FILE = os.path.join(OUTPUT_DIR, 'fingerprints13.bin')  # 公告指纹索引（变更检测）
+SQLITE_FILE = os.path.join(OUTPUT_DIR, 'ted13.db')  # 按 (公告编号, 批次编号) upsert 的SQLite库
+REFRESH_FILE = os.path.join(OUTPUT_DIR, 'ted_api_tenders_refresh13.csv')  # 按编号刷新的公告
+REPROCESS_FILE = os.path.join(OUTPUT_DIR, 'ted_api_tenders_cached13.csv')  # 从缓存归档重新提取的结果
+REPROCESS_BATCH = 5000  # 批量提取每批的公告数
+REFRESH_BATCH = 500  # 按编号重新抓取时每批写出的公告数
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+REQUESTS_PER_SECOND = 5  # 初始每秒请求数（随服务器响应自适应调整）
+SHARD_BY = 'publication-date'  # 分片依据的分面（publication-date 或 buyer-country）
+SHARD_WORKERS = 4  # 并行抓取的分片数
+PAGINATION_MODE = PAGINATION_AUTO  # 分页方式：优先游标分页，不支持时退回页码
+
+# 批次行的输出schema：列名 -> 依赖的API字段
+# 履行地和估计价值在行中总是取批次级的值（公告级的值会被批次覆盖），因此只依赖 lots
+LOT_SCHEMA = OutputSchema([
+    ('notice_number', ['publication-number']),
+    ('notice_type', ['notice-type']),
+    ('business_opportunity', ['business-opportunity']),
+    ('publication_date', ['publication-date']),
+    ('procedure_type', ['procedure-type']),
+    ('contract_nature', ['contract-nature']),
+    ('deadline', ['deadline-receipt-request']),
+    ('change_version', ['change-notice-version-identifier']),
+    ('buyer_name', ['buyer-name']),
+    ('buyer_legal_type', ['buyer-legal-type']),
+    ('buyer_country', ['buyer-country']),
+    ('title', ['notice-title']),
+    ('link', ['links']),
+    ('main_cpv', ['cpv']),
+    ('lot_identifier', ['lots']),
+    ('lot_title', ['lots']),
+    ('purpose_cpv', ['lots']),
+    ('place_of_performance', ['lots']),
+    ('estimated_value', ['lots']),
+    ('estimated_currency', ['lots']),
+    ('estimated_duration', ['lots']),
+    ('winner_selection_status', ['lots']),
+    ('reason_no_winner', ['lots']),
+    ('winner_name', ['lots']),
+    ('winner_value', ['lots']),
+    ('winner_currency', ['lots']),
+    ('contract_date', ['lots']),
+], required_fields=['publication-number', 'change-notice-version-identifier'], profiles={
+    # 每个公告一行，不请求批次
+    'notice': ['notice_number', 'notice_type', 'business_opportunity', 'publication_date',
+               'procedure_type', 'contract_nature', 'deadline', 'change_version',
+               'buyer_name', 'buyer_legal_type', 'buyer_country', 'title', 'link', 'main_cpv'],
+    # 中标结果
+    'awards': ['notice_number', 'publication_date', 'buyer_name', 'buyer_country', 'main_cpv',
+               'lot_identifier', 'winner_selection_status', 'winner_name', 'winner_value',
+               'winner_currency', 'contract_date'],
+}, categorical=['notice_type', 'procedure_type', 'contract_nature', 'buyer_name', 'buyer_legal_type',
+                'buyer_country', 'estimated_currency', 'winner_selection_status', 'winner_currency'])
+LOT_COLUMNS = LOT_SCHEMA.names  # 批次行的全部字段（Parquet输出的固定schema）
+OUTPUT_PROFILE = 'full'  # 输出的列组合（决定请求哪些字段）
+
+# 公告级字段的取值声明（导入时编译成取值函数）
+NOTICE_FIELDS = compile_fields({
+    'notice_type': Field('notice-type', 'label'),
+    'procedure_type': Field('procedure-type', 'label'),
+    'contract_nature': Field('contract-nature', FIRST, 'label'),  # 字典，或字典列表取第一个
+    'deadline': Field('deadline-receipt-request', FIRST),
+    'buyer_name': Field('buyer-name', text=TEXT_FIRST_ITEM),
+    'buyer_legal_type': Field('buyer-legal-type', 'label'),
+    'buyer_country': Field('buyer-country', FIRST, 'label'),
+    'title': Field('notice-title', text=TEXT_PREFERRED, prefer='eng'),
+    'link': Field('links', 'html', text=TEXT_PRESENT, prefer='ENG'),
+    'main_cpv': Field('cpv', FIRST, 'code'),
+})
+# 批次级字段（两种键名拼写都可能出现）
+LOT_FIELDS = compile_fields({
+    'lot_identifier': Field(('lotIdentifier', 'lot-identifier')),
+    'lot_title': Field('title', text=TEXT_FIRST_ITEM),
+    'purpose_cpv': Field('purpose', FIRST, 'cpv', FIRST, 'code'),
+    'estimated_duration': Field(('estimatedDuration', 'estimated-duration'), FIRST, 'duration'),
+})
+# 中标信息字段
+AWARD_FIELDS = compile_fields({
+    'winner_selection_status': Field(('winnerSelectionStatus', 'winner-selection-status')),
+    'reason_no_winner': Field(('reasonNoWinner', 'reason-no-winner')),
+    'winner_name': AnyOf(*[Field('winner', FIRST, key, text=TEXT_FIRST_ITEM)
+                           for key in ('officialName', 'official-name', 'name', 'legalName')]),
+    'contract_date': Field('contract-date'),
+})
+
+QUERY = "(classification-cpv IN (44000000 45000000))  SORT BY publication-number DESC"
+
 API_URL = 'https://tedweb.api.ted.europa.eu/private-search/api/v1/notices/search'
 
 HEADERS = {
@@ -34,95 +132,66 @@ HEADERS = {
 }
 
 
-def create_payload(page_number=1, page_size=50):
-    return {
-        "query": "(classification-cpv IN (44000000 45000000))  SORT BY publication-number DESC",
+def create_payload(page_number=1, page_size=50, query=QUERY, pagination=None, columns=None):
+    payload = {
+        "query": query,
         "page": page_number,
         "limit": page_size,
-        "fields": [
-            "publication-number",
-            "notice-type",
-            "buyer-name",
-            "buyer-country",
-            "buyer-legal-type",
-            "contract-nature",
-            "publication-date",
-            "notice-title",
-            "links",
-            "business-opportunity",
-            "cpv",
-            "place-of-performance",
-            "estimated-value",
-            "awards",
-            "lots",
-            "procedure-type",
-            "deadline-receipt-request",
-            "change-notice-version-identifier"
-        ],
+        "fields": LOT_SCHEMA.fields(columns),  # 只请求输出列需要的字段
         "validation": False,
         "scope": "ALL",
         "language": "EN",
         "onlyLatestVersions": True,
-        "facets": {
-            "business-opportunity": [],
-            "cpv": [],
-            "contract-nature": [],
-            "place-of-performance": [],
-            "procedure-type": [],
-            "publication-date": [],
-            "buyer-country": []
-        }
+        "facets": {}  # 分面统计只在分片规划时单独请求
     }
+    if pagination:
+        # 游标分页时用分页字段替换页码
+        payload.pop("page")
+        payload.update(pagination)
+    return payload
 
-# 定义文件缓存路径
-def get_cache_file_path(page_number):
-    return Path(CACHE_DIR) / f'ted_api_raw_page{page_number}.json'
+# 搜索页缓存（键为完整请求体的哈希，带有效期和容量上限）
+search_cache = SearchCache(CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES)
 
 # 从缓存中加载数据
-def load_from_cache(page_number):
-    cache_file = get_cache_file_path(page_number)
-    if cache_file.exists():
-        try:
-            logger.info(f"从缓存中加载第 {page_number} 页的数据")
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"加载第 {page_number} 页缓存时出错: {str(e)}")
-    return None
-
-# 将数据保存到缓存中
-def save_to_cache(data, page_number):
+def load_from_cache(payload):
+    data = search_cache.get(payload)
+    if data:
+        logger.info(f"从缓存中加载第 {payload['page']} 页的数据")
+    return data
+
+# 将数据保存到缓存中（公告在被迭代时逐条写入，整页迭代完后写入页面清单）
+def save_to_cache(data, payload, page_number=1):
     if not data:
-        return
+        return data
 
-    cache_file = get_cache_file_path(page_number)
-    try:
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        logger.info(f"已将数据保存到缓存: {cache_file}")
-    except Exception as e:
-        logger.error(f"保存第 {page_number} 页缓存时出错: {str(e)}")
+    # 游标分页的请求体含一次性令牌，页面清单按不含令牌的请求体和页序号保存（用于LRU和保留归档的公告）
+    data['notices'] = search_cache.put_iter(payload, data.get('notices', []), data,
+                                            key_payload=cache_payload(payload, page_number))
+    return data
 
 # 从API获取招标信息
-def fetch_tenders(session, page_number=1, page_size=50, use_cache=True):
+def fetch_tenders(session, page_number=1, page_size=50, use_cache=True, query=QUERY, pagination=None,
+                  columns=None):
+    payload = create_payload(page_number, page_size, query, pagination, columns)
+    # 游标令牌有时效，游标分页的页面不走缓存
+    use_cache = use_cache and 'paginationMode' not in payload
+
     if use_cache:
-        cached_data = load_from_cache(page_number)
+        cached_data = load_from_cache(payload)
         if cached_data:
             return cached_data
 
-    payload = create_payload(page_number, page_size)
-
     try:
         logger.info(f"正在从API请求第 {page_number} 页的数据...")
-        response = session.post(API_URL, json=payload)
+        response = ted_http.request('POST', API_URL, session=session, json=payload, stream=True)
 
         if response.status_code == 200:
-            data = response.json()
-            logger.info(f"成功获取第 {page_number} 页的数据")
-
-            save_to_cache(data, page_number)
+            # 公告在迭代时才逐条解码，提取与下载重叠进行
+            data = stream_search_response(response)
+            logger.info(f"开始接收第 {page_number} 页的数据")
 
-            return data
+            return save_to_cache(data, payload, page_number)
         else:
             logger.error(f"请求失败，状态码: {response.status_code}")
             logger.error(f"响应内容: {response.text}")
@@ -186,29 +255,12 @@ def extract_value(data):
 def extract_award_info(award):
     """提取中标信息"""
     winner_info = {
-        'winner_name': "",
+        'winner_name': AWARD_FIELDS['winner_name'](award),
         'winner_value': "",
         'winner_currency': "",
-        'contract_date': award.get('contract-date', '')
+        'contract_date': AWARD_FIELDS['contract_date'](award)
     }
 
-    # 提取中标者名称
-    winner = award.get('winner', [])
-    if winner:
-        first_winner = winner[0] if isinstance(winner, list) else winner
-
-        # 尝试多个可能的名称字段
-        for field in ['officialName', 'official-name', 'name', 'legalName']:
-            name_data = first_winner.get(field, {})
-            if name_data:
-                # 动态遍历所有语言
-                for lang, names in name_data.items():
-                    if names and len(names) > 0:
-                        winner_info['winner_name'] = names[0]
-                        break
-                if winner_info['winner_name']:
-                    break
-
     # 提取中标value
     value = award.get('value', [])
     if value:
@@ -219,61 +271,33 @@ def extract_award_info(award):
 
 def extract_lot_info(lot):
     """提取单个批次信息"""
-    lot_info = {
-        'lot_identifier': lot.get('lotIdentifier', lot.get('lot-identifier', '')),
-        'lot_title': '',
-        'purpose_cpv': "",
+    # 标识、标题、CPV和持续时间由编译好的取值函数提取
+    lot_info = LOT_FIELDS.extract(lot)
+    lot_info.update({
         'place_of_performance': "",
         'estimated_value': "",
         'estimated_currency': "",
-        'estimated_duration': "",
         'winner_selection_status': "",
         'reason_no_winner': "",
-    }
-
-    # 提取标题
-    title_data = lot.get('title', {})
-    if title_data:
-        for names in title_data.values():
-            if names and len(names) > 0:
-                lot_info['lot_title'] = names[0]
-                break
-
-    # 提取CPV分类
-    purpose = lot.get('purpose', [])
-    if purpose:
-        first_purpose = purpose[0] if isinstance(purpose, list) else purpose
-        cpv_list = first_purpose.get('cpv', [])
-        if cpv_list:
-            first_cpv = cpv_list[0] if isinstance(cpv_list, list) else cpv_list
-            lot_info['purpose_cpv'] = first_cpv.get('code', '')
+    })
 
     # 提取履行地国家
-
     place_of_performance = lot.get('place-of-performance', [])
     if place_of_performance and len(place_of_performance) > 0:
         places = [place.get('label', '') for place in place_of_performance if place.get('label')]
         lot_info['place_of_performance'] = ', '.join(places)
-    else:
-        lot_info['place_of_performance'] = ''
 
-    # 提取估计价值和持续时间
+    # 提取估计价值
     estimated_value = lot.get('estimated-value', [])
     if estimated_value:
         lot_info['estimated_value'], lot_info['estimated_currency'] = extract_value(estimated_value)
 
-    duration = lot.get('estimatedDuration', lot.get('estimated-duration', []))
-    if duration:
-        duration_data = duration[0] if isinstance(duration, list) else duration
-        lot_info['estimated_duration'] = duration_data.get('duration', '')
-
     # 提取中标信息
     awards = lot.get('awards', [])
     if awards:
         award = awards[0] if isinstance(awards, list) else awards
-        lot_info['winner_selection_status'] = award.get('winnerSelectionStatus',
-                                                        award.get('winner-selection-status', ''))
-        lot_info['reason_no_winner'] = award.get('reasonNoWinner', award.get('reason-no-winner', ''))
+        lot_info['winner_selection_status'] = AWARD_FIELDS['winner_selection_status'](award)
+        lot_info['reason_no_winner'] = AWARD_FIELDS['reason_no_winner'](award)
 
         # 提取中标详细信息
         winner_info = extract_award_info(award)
@@ -281,146 +305,106 @@ def extract_lot_info(lot):
 
     return lot_info
 
-def extract_tender_info(notice):
-    """提取招标信息，处理多批次情况"""
+
+def extract_tender_info(notice, columns=None):
+    """提取招标信息，处理多批次情况；指定 columns 时只输出这些列，不需要批次列时每个公告一行"""
     tenders = []
 
-    # 提取公告级别信息
+    # 提取公告级别信息（多语言、多种结构的字段由编译好的取值函数统一处理）
     common_info = {
         'notice_number': notice.get('publication-number', ''),
-        'notice_type': notice.get('notice-type', {}).get('label', ''),
         'business_opportunity': notice.get('business-opportunity', ''),#商机
         'publication_date': notice.get('publication-date', ''),
-        'procedure_type': notice.get('procedure-type', {}).get('label', ''),
-        'contract_nature': '',  # 初始化合同性质为空字符串
-        'deadline': notice.get('deadline-receipt-request', [''])[0],
         'change_version': notice.get('change-notice-version-identifier', '')
     }
+    NOTICE_FIELDS.extract(notice, common_info)
+    # 履行地和估计价值在行中总是取批次级的值（见 LOT_SCHEMA）
 
-    """"√"""
-    # 处理 contract-nature 合同主要性质
-    contract_nature = notice.get('contract-nature', {})
-    if isinstance(contract_nature, dict):
-        common_info['contract_nature'] = contract_nature.get('label', '')
-    elif isinstance(contract_nature, list):
-        # 如果是列表，你可以根据具体需求处理，这里简单取第一个元素的 label
-        if contract_nature and isinstance(contract_nature[0], dict):
-            common_info['contract_nature'] = contract_nature[0].get('label', '')
-    """"√"""
-    # 提取买方信息
-    buyer_name = notice.get('buyer-name', {})
-    if buyer_name:
-        for names in buyer_name.values():  # 不需要语言键，只需第一个非空值
-            if names and len(names) > 0:  # 确保列表非空
-                common_info['buyer_name'] = names[0]
-                break
-        else:
-            common_info['buyer_name'] = ''
-
-    """"√"""
-    buyer_country = notice.get('buyer-country', [])
-    common_info['buyer_country'] = buyer_country[0].get('label', '') if buyer_country else ''
-
-    buyer_legal_type = notice.get('buyer-legal-type', {})
-    common_info['buyer_legal_type'] = buyer_legal_type.get('label', '') if buyer_legal_type else ''
-
-    """"√"""
-    # 提取公告标题
-    notice_title = notice.get('notice-title', {})
-    common_info['title'] = notice_title.get('eng', '')
-    if not common_info['title']:
-        for lang in notice_title:
-            if notice_title[lang]:
-                common_info['title'] = notice_title[lang]
-                break
-    """"√"""
-    # 提取公告链接
-    links = notice.get('links', {})
-    common_info['link'] = ''
-    if links:
-        html_links = links.get('html', {})
-        if html_links and 'ENG' in html_links:
-            common_info['link'] = html_links['ENG']
-        elif html_links:
-            for lang in html_links:
-                if html_links[lang]:
-                    common_info['link'] = html_links[lang]
-                    break
-
-    # 提取主CPV分类
-    cpv_list = notice.get('cpv', [])
-    common_info['main_cpv'] = cpv_list[0].get('code', '') if cpv_list else ''
-
-    # 提取履行地国家（公告级别）
-    place_of_performance = notice.get('place-of-performance', [])
-    if place_of_performance and len(place_of_performance) > 0:
-        places = [place.get('label','') for place in place_of_performance if place.get('label')]
-        common_info['place_of_performance'] = ', '.join(places)
-    else:
-        common_info['place_of_performance'] = ''
-
-
-
-    # 提取估计价值（公告级别）
-    estimated_value = notice.get('estimated-value', [])
-    if estimated_value:
-        common_info['estimated_value'], common_info['estimated_currency'] = extract_value(estimated_value[0])
-    else:
-        common_info['estimated_value'] = ''
-        common_info['estimated_currency'] = ''
-
-    # 处理批次信息
-    lots = notice.get('lots', [])
+    # 处理批次信息：同一公告的批次行共享公告级的值，批次级的值每行单独存放
+    layout = LOT_SCHEMA.layout(columns)
+    common = layout.common(common_info)
+    lots = notice.get('lots', []) if layout.lot_columns else []
     if not lots:
         # 如果没有批次，创建单个虚拟批次
-        lot_info = extract_lot_info({})
-        tender = {**common_info, **lot_info}
-        tenders.append(tender)
+        tenders.append(layout.row(common, extract_lot_info({})))
     else:
-        # 处理每个批次
-        for lot in lots:
+        # 处理每个批次（没有批次标识时按位置编号，避免同一公告的批次行主键相同）
+        for position, lot in enumerate(lots):
             lot_info = extract_lot_info(lot)
-            tender = {**common_info, **lot_info}
-            tenders.append(tender)
-
+            lot_info['lot_identifier'] = lot_key(lot_info['lot_identifier'], position)
+            tenders.append(layout.row(common, lot_info))
     return tenders
 
 
+def extract_page_table(notices, columns=None):
+    """把一批公告（一页或整个缓存归档）一次性展开成批次级的表
+
+    结果与逐行调用 extract_tender_info 相同：公告级的列每个公告只算一次，
+    按各公告的批次数广播到批次行；批次级的列在展开后的批次列上按列计算。
+    """
+    columns = LOT_SCHEMA.select(columns)
+    notices = list(notices)
 
-def save_data(data, filename, append=False):
+    def column(field):
+        return [notice.get(field, '') for notice in notices]
+
+    common = {
+        'notice_number': column('publication-number'),
+        'business_opportunity': column('business-opportunity'),
+        'publication_date': column('publication-date'),
+        'change_version': column('change-notice-version-identifier'),
+    }
+    # 多语言、多种结构的字段按列调用编译好的取值函数
+    for name, accessor in NOTICE_FIELDS.items():
+        if name in columns:
+            common[name] = [accessor(notice) for notice in notices]
+    common = {name: values for name, values in common.items() if name in columns}
+
+    # 按批次展开（没有批次的公告对应一个空批次），公告级的列按位置广播
+    if not LOT_SCHEMA.needs('lots', columns):
+        table = ted_table.broadcast(common, range(len(notices)))
+        return ted_table.categorize(table[columns], LOT_SCHEMA.categorical)
+    lot_lists = [notice.get('lots') for notice in notices]
+    index, offsets, lots = ted_table.explode(lot_lists)
+    table = ted_table.broadcast(common, index)
+
+    def places(value):
+        return ', '.join(place.get('label', '') for place in value if place.get('label')) if value else ''
+
+    for name, accessor in LOT_FIELDS.items():
+        table[name] = [accessor(lot) for lot in lots]
+    table['lot_identifier'] = [value if position < 0 else lot_key(value, position) for value, position
+                               in zip(table['lot_identifier'], offsets.tolist())]
+    estimated = [extract_value(v) if v else ('', '') for v in ted_table.pluck(lots, 'estimated-value', [])]
+    award = ted_table.first_of(ted_table.pluck(lots, 'awards', []))
+    winner = [extract_award_info(a) if a else {} for a in award]
+    table['place_of_performance'] = [places(v) for v in ted_table.pluck(lots, 'place-of-performance', [])]
+    table['estimated_value'] = [v[0] for v in estimated]
+    table['estimated_currency'] = [v[1] for v in estimated]
+    for name in ('winner_selection_status', 'reason_no_winner'):
+        table[name] = [AWARD_FIELDS[name](a) if a else '' for a in award]
+    for col in ('winner_name', 'winner_value', 'winner_currency', 'contract_date'):
+        table[col] = ted_table.pluck(winner, col)
+    return ted_table.categorize(table[columns].astype(object), LOT_SCHEMA.categorical)
+
+
+def check_page_table(notices, columns=None):
+    """检查批量提取与逐行 extract_tender_info 的结果是否一致（并比较耗时）"""
+    columns = LOT_SCHEMA.select(columns)
+    return ted_table.compare_extraction(notices, lambda n: extract_tender_info(n, columns),
+                                        lambda ns: extract_page_table(ns, columns), columns)
+
+
+def save_data(data, filename, append=False, columns=None):
     if not data:
         return
 
-    # 确保所有记录都有相同的字段
-    all_keys = set()
-    for record in data:
-        all_keys.update(record.keys())
-
-    # 创建包含所有字段的DataFrame
-    df = pd.DataFrame(data)
-
-    # 定义CSV列顺序
-    column_order = [
-        'notice_number', 'notice_type', 'business_opportunity',
-        'publication_date', 'procedure_type', 'contract_nature',
-        'deadline', 'change_version',
-        'buyer_name', 'buyer_legal_type', 'buyer_country',
-        'title', 'link', 'main_cpv',
-        'place_of_performance_country', 'estimated_value', 'estimated_currency',
-        'lot_identifier', 'lot_title', 'purpose_cpv',
-        'place_of_performance_country', 'estimated_value', 'estimated_currency',
-        'estimated_duration',
-        'winner_selection_status', 'reason_no_winner',
-        'winner_name', 'winner_value', 'winner_currency', 'contract_date'
-    ]
-
-    # 添加缺失的列
-    for col in column_order:
-        if col not in df.columns:
-            df[col] = None
+    # CSV列顺序：输出列（未指定时为schema的全部列）
+    column_order = list(columns) if columns else LOT_SCHEMA.names
 
-    # 按指定顺序排列列
-    df = df[column_order]
+    # 行（LotRow 或字典）只在写出时按列顺序转换成DataFrame，缺失的列为空；重复度高的列用分类类型
+    df = pd.DataFrame([[row.get(col) for col in column_order] for row in data], columns=column_order)
+    df = ted_table.categorize(df, LOT_SCHEMA.categorical)
 
     mode = 'a' if append else 'w'
     header = not (append and os.path.exists(filename))
@@ -429,61 +413,321 @@ def save_data(data, filename, append=False):
     logger.info(f"已将 {len(df)} 条记录保存到 {filename}")
 
 
-def scrape_ted_api(max_pages=3, use_cache=True):
-    all_tenders = []
+def iter_tenders(max_pages=3, use_cache=True, parquet_dir=None, incremental=False, resume=False,
+                 sqlite_path=None, skip_unchanged=False, pagination=PAGINATION_MODE, profile=OUTPUT_PROFILE):
+    """抓取流水线：页面 → 公告 → 批次行 → 输出，逐行产出已写入输出的批次行
+
+    公告在流式解码的页面上逐条过滤和提取，每页的行写入CSV和各输出后才产出，
+    内存中最多只保留一页的行（Parquet另有按批次写盘的缓冲）。页面的行在各输出都落盘后
+    才记录检查点和公告指纹。调用方可以随时停止迭代：输出会正常关闭，
+    检查点保留（可续爬），增量模式不推进水位线。
+    """
+    columns = LOT_SCHEMA.select(profile)
     total_count = 0
+    total_rows = 0
+    completed = False
+    # 检查点：resume=True 时跳过上次已完成的页面和公告
+    checkpoint = CrawlCheckpoint(CHECKPOINT_FILE, resume=resume)
+    # 只输出增量时（增量模式、续爬、变更检测）追加到已有的Parquet分区，否则覆盖
+    parquet_sink = (ParquetSink(parquet_dir, columns=columns, categorical_columns=LOT_SCHEMA.categorical,
+                                append=incremental or resume or skip_unchanged) if parquet_dir else None)
+    sqlite_sink = SqliteSink(sqlite_path, columns=columns) if sqlite_path else None
+    # 变更检测：版本号和内容都未变化的公告不再提取和输出
+    change_index = ChangeIndex(CHANGE_INDEX_FILE) if skip_unchanged else None
+    # 增量模式：只抓取上次水位线之后的新公告，并追加到已有输出
+    tracker = IncrementalCrawl(WatermarkStore(WATERMARK_FILE), QUERY) if incremental else None
+
+    def complete(pages):
+        # 页面的行已全部落盘：记录指纹和检查点
+        for page, ids in pages:
+            if change_index:
+                change_index.commit(ids)
+            checkpoint.complete_page(page, ids)
 
     logger.info(f"开始TED API数据抓取，计划抓取 {max_pages} 页...")
 
-    session = requests.Session()
+    session = ted_http.get_session()
     session.headers.update(HEADERS)
 
-    for page_number in range(1, max_pages + 1):
-        logger.info(f"\n正在抓取第 {page_number} 页...")
-
-        data = fetch_tenders(session, page_number, use_cache=use_cache)
-
-        if not data:
-            logger.error(f"获取第 {page_number} 页数据失败，停止抓取")
-            break
-
-        notices = data.get('notices', [])
-
-        if not notices:
-            logger.warning(f"第 {page_number} 页没有公告数据，停止抓取")
-            break
-
-        if page_number == 1 and 'totalNoticeCount' in data:
-            total_count = data.get('totalNoticeCount', 0)
-            logger.info(f"共找到 {total_count} 条招标公告")
-
-        page_tenders = []
-        for notice in notices:
-            tenders = extract_tender_info(notice)
-            page_tenders.extend(tenders)
+    # 检查点中已完成的页面不再产出（页码分页时也不再请求）
+    # 启用缓存时 AUTO 模式使用页码分页（游标分页的页面无法从缓存读取）
+    paginator = Paginator(lambda page, params: fetch_tenders(session, page, use_cache=use_cache,
+                                                              pagination=params, columns=columns),
+                          mode=pagination_mode(pagination, use_cache))
+    try:
+        for page_number, data in paginator.pages(max_pages, skip=checkpoint.page_done):
+            logger.info(f"\n正在处理第 {page_number} 页...")
+            checkpoint.start_page(page_number)
+
+            # 公告逐条经过过滤和提取，整页的原始JSON不会同时留在内存中
+            notices = data.get('notices', [])
+            if tracker:
+                notices = tracker.iter_new(notices)
+            notices = (n for n in notices if not checkpoint.notice_done(n.get('publication-number')))
+            if change_index:
+                notices = (n for n in notices if change_index.changed(n))
+
+            page_tenders = []
+            page_ids = []
+            for notice in notices:
+                page_ids.append(notice.get('publication-number'))
+                page_tenders.extend(extract_tender_info(notice, columns))
+                if change_index:
+                    change_index.stage(notice.get('publication-number'))
+            if paginator.failed:
+                # 读取中断的页面不输出，续爬时整页重新抓取
+                break
 
-        logger.info(f"从第 {page_number} 页提取了 {len(page_tenders)} 条记录")
+            # 总数在响应中位于公告列表之后，整页读完才能取到
+            if not total_count and 'totalNoticeCount' in data:
+                total_count = data.get('totalNoticeCount', 0)
+                logger.info(f"共找到 {total_count} 条招标公告")
+
+            logger.info(f"从第 {page_number} 页提取了 {len(page_tenders)} 条记录")
+
+            # 只输出增量时（增量模式、续爬、变更检测）追加到已有文件
+            append = incremental or resume or skip_unchanged or page_number > 1
+            save_data(page_tenders, OUTPUT_FILE, append=append, columns=columns)
+            if sqlite_sink:
+                # 每页一个事务，新版本公告原地更新
+                sqlite_sink.write_rows(page_tenders)
+                sqlite_sink.flush()
+            if parquet_sink:
+                # Parquet跨页缓冲、按批次写盘，检查点只记录行已全部落盘的页面
+                parquet_sink.write_rows(page_tenders)
+                parquet_sink.mark((page_number, page_ids))
+                complete(parquet_sink.take_flushed())
+            else:
+                complete([(page_number, page_ids)])
+
+            total_rows += len(page_tenders)
+            yield from page_tenders
+
+            if tracker and tracker.reached:
+                logger.info(f"第 {page_number} 页已到达上次水位线，停止翻页")
+                break
+        completed = not paginator.failed
+    finally:
+        # 正常结束、翻页失败或调用方提前停止迭代，都关闭输出并保存状态
+        if paginator.failed:
+            logger.error("获取页面数据失败，停止抓取")
+        if tracker and (not completed or paginator.gaps):
+            tracker.mark_gap()
+        if tracker:
+            tracker.finish()
+        if sqlite_sink:
+            sqlite_sink.close()
+        if parquet_sink:
+            parquet_sink.close()
+            complete(parquet_sink.take_flushed())
+        if change_index:
+            change_index.close()
+        if completed:
+            checkpoint.finish()
+        else:
+            checkpoint.close()
+            logger.info(f"抓取未完成，可设置 resume=True 从检查点继续: {CHECKPOINT_FILE}")
+        logger.info(f"\n抓取完成，共抓取了 {total_rows} 条记录")
+
+
+def scrape_ted_api(max_pages=3, use_cache=True, parquet_dir=None, incremental=False, resume=False,
+                   sqlite_path=None, skip_unchanged=False, pagination=PAGINATION_MODE, profile=OUTPUT_PROFILE):
+    """运行整个抓取流水线，与原接口相同返回全部记录（字典列表）
+
+    全部行都会留在内存中；只需要写出输出时用 run_scraper，逐行处理时直接迭代 iter_tenders。
+    """
+    return [dict(row) for row in iter_tenders(max_pages, use_cache, parquet_dir, incremental, resume,
+                                              sqlite_path, skip_unchanged, pagination, profile)]
+
+
+def run_scraper(max_pages=3, use_cache=True, parquet_dir=None, incremental=False, resume=False,
+                sqlite_path=None, skip_unchanged=False, pagination=PAGINATION_MODE, profile=OUTPUT_PROFILE):
+    """运行整个抓取流水线（行只写入输出，不在内存中收集），返回写入的记录数"""
+    return sum(1 for _ in iter_tenders(max_pages, use_cache, parquet_dir, incremental, resume,
+                                       sqlite_path, skip_unchanged, pagination, profile))
+
+
+def scrape_shard(session, shard, use_cache=True, page_size=50, columns=None, claims=None):
+    """逐页抓取一个分片的子查询，直到取完该分片的公告；每页产出一次该页的批次行
+
+    指定 claims（NoticeClaims）时跳过已由其他分片输出的公告。
+    """
+    total = 0
+    paginator = Paginator(lambda page, params: fetch_tenders(session, page, page_size, use_cache,
+                                                              shard.query, params, columns),
+                          mode=pagination_mode(PAGINATION_MODE, use_cache))
+    for page_number, data in paginator.pages():
+        tenders = []
+        claimed = []
+        for notice in data['notices']:
+            if claims:
+                if not claims.claim(notice):
+                    continue
+                claimed.append(notice.get('publication-number'))
+            tenders.extend(extract_tender_info(notice, columns))
+        if paginator.failed:
+            # 读取中断的页面不完整，不交给输出；已认领的公告还给其他分片
+            if claims:
+                claims.release(claimed)
+            raise RuntimeError(f"第 {page_number} 页读取中断")
+        total += len(tenders)
+        yield tenders
+    if paginator.failed:
+        raise RuntimeError("翻页请求失败")
+    logger.info(f"分片 {shard.label} 提取了 {total} 条记录")
+
+
+def iter_tenders_sharded(by=SHARD_BY, workers=SHARD_WORKERS, use_cache=True, parquet_dir=None,
+                         sqlite_path=None, profile=OUTPUT_PROFILE):
+    """全量抓取：先按分面统计把查询拆成数量已知的分片，再并行抓取各分片
+
+    每个分片都从第1页翻起，避免单个查询的深分页；分片之间没有先后关系，
+    因此不支持增量和断点续爬，失败的分片会在日志中列出（其失败前的页面已写入输出）。
+    各分片逐页交给输出，每页写入后逐行产出，内存中最多保留约 2 × workers 页的行。
+    """
+    columns = LOT_SCHEMA.select(profile)
+    total_rows = 0
+    failed = []
+    parquet_sink = (ParquetSink(parquet_dir, columns=columns, categorical_columns=LOT_SCHEMA.categorical,
+                                append=False) if parquet_dir else None)
+    sqlite_sink = SqliteSink(sqlite_path, columns=columns) if sqlite_path else None
+
+    session = ted_http.get_session()
+    session.headers.update(HEADERS)
 
-        all_tenders.extend(page_tenders)
+    shards = plan_shards(create_payload(), by=by, session=session)
+    # 日期分片互不重叠；按多值字段（如买方国家）分片时同一公告可能出现在多个分片，按公告编号去重
+    claims = NoticeClaims() if by != 'publication-date' else None
+    try:
+        for shard, tenders in crawl_shards(shards, lambda s: scrape_shard(session, s, use_cache, columns=columns,
+                                                                          claims=claims), workers):
+            if tenders is None:
+                failed.append(shard.label)
+                continue
+            save_data(tenders, OUTPUT_FILE, append=bool(total_rows), columns=columns)
+            if parquet_sink:
+                parquet_sink.write_rows(tenders)
+            if sqlite_sink:
+                sqlite_sink.write_rows(tenders)
+                sqlite_sink.flush()
+            total_rows += len(tenders)
+            yield from tenders
+    finally:
+        if parquet_sink:
+            parquet_sink.close()
+        if sqlite_sink:
+            sqlite_sink.close()
+        if failed:
+            logger.error(f"以下分片抓取失败: {', '.join(failed)}")
+        if claims and claims.duplicates:
+            logger.info(f"跳过了 {claims.duplicates} 个在多个分片中重复出现的公告")
+        logger.info(f"\n抓取完成，{len(shards)} 个分片共抓取了 {total_rows} 条记录")
+
+
+def scrape_ted_api_sharded(by=SHARD_BY, workers=SHARD_WORKERS, use_cache=True, parquet_dir=None,
+                           sqlite_path=None, profile=OUTPUT_PROFILE):
+    """分片运行整个抓取流水线，返回写入的记录数"""
+    return sum(1 for _ in iter_tenders_sharded(by, workers, use_cache, parquet_dir, sqlite_path, profile))
+
+
+def refresh_notices(numbers, sqlite_path=None, parquet_dir=None, profile=OUTPUT_PROFILE):
+    """按公告编号列表重新抓取指定公告（批量查询，每个请求包含多个编号）
+
+    结果写入 REFRESH_FILE，并upsert到SQLite（替换库中这些公告的旧批次行）。
+    行按 REFRESH_BATCH 个公告一批写入各输出，内存中最多保留一批的行；返回写入的记录数。
+    """
+    columns = LOT_SCHEMA.select(profile)
+    parquet_sink = (ParquetSink(parquet_dir, columns=columns, categorical_columns=LOT_SCHEMA.categorical)
+                    if parquet_dir else None)
+    sqlite_sink = SqliteSink(sqlite_path, columns=columns) if sqlite_path else None
+    session = ted_http.get_session()
+    session.headers.update(HEADERS)
 
-        save_data(page_tenders, OUTPUT_FILE, append=(page_number > 1))
+    total_rows = 0
+    missing = []
 
-        if page_number < max_pages:
-            delay = 2.0
-            logger.info(f"等待 {delay} 秒后再抓取下一页")
-            time.sleep(delay)
+    def write(rows):
+        save_data(rows, REFRESH_FILE, append=bool(total_rows), columns=columns)
+        if parquet_sink:
+            parquet_sink.write_rows(rows)
+        if sqlite_sink:
+            sqlite_sink.write_rows(rows)
 
-    logger.info(f"\n抓取完成，共抓取了 {len(all_tenders)} 条记录")
-    return all_tenders
+    try:
+        tenders = []
+        batch = 0
+        for number, notice in lookup_notices(numbers, LOT_SCHEMA.fields(columns), session=session):
+            if notice is None:
+                missing.append(number)
+                continue
+            tenders.extend(extract_tender_info(notice, columns))
+            batch += 1
+            if batch >= REFRESH_BATCH:
+                write(tenders)
+                total_rows += len(tenders)
+                tenders = []
+                batch = 0
+        if tenders:
+            write(tenders)
+            total_rows += len(tenders)
+    finally:
+        if parquet_sink:
+            parquet_sink.close()
+        if sqlite_sink:
+            sqlite_sink.close()
+    if missing:
+        logger.warning(f"{len(missing)} 个公告未找到: {', '.join(missing[:20])}")
+    return total_rows
+
+
+def reprocess_cache(profile=OUTPUT_PROFILE, batch_size=REPROCESS_BATCH, verify=False):
+    """不请求API，用批量提取把缓存归档中的全部公告重新展开成批次行，写入 REPROCESS_FILE
+
+    verify=True 时每批同时逐行提取并比较结果（用于确认两条路径一致）。
+    """
+    columns = LOT_SCHEMA.select(profile)
+    notices = search_cache.iter_notices(create_payload(columns=columns))
+    total = 0
+    header = True
+    while True:
+        batch = list(itertools.islice(notices, batch_size))
+        if not batch:
+            break
+        if verify:
+            check_page_table(batch, columns)
+        table = extract_page_table(batch, columns)
+        table.to_csv(REPROCESS_FILE, mode='w' if header else 'a', header=header, index=False, encoding='utf-8-sig')
+        header = False
+        total += len(table)
+    logger.info(f"从缓存重新提取了 {total} 条记录，保存到 {REPROCESS_FILE}")
+    return total
 
 
 if __name__ == "__main__":
     MAX_PAGES = 10
     USE_CACHE = True
-
+    WRITE_PARQUET = False  # 同时输出按发布日期分区的Parquet（需要安装pyarrow）
+    INCREMENTAL = False  # 增量模式：只抓取上次运行之后发布的公告
+    RESUME = False  # 从上次中断的检查点继续
+    WRITE_SQLITE = True  # 同时upsert到SQLite库
+    SKIP_UNCHANGED = False  # 跳过版本和内容都未变化的公告（只输出新增和变更）
+    SHARDED = False  # 全量抓取：按分面拆分查询并行抓取（忽略页数上限）
+    REPROCESS = False  # 不请求API，从缓存归档批量重新提取
+    VERIFY_BATCH = False  # 重新提取时检查批量提取与逐行提取是否一致
+
+    ted_http.configure_rate_limit(REQUESTS_PER_SECOND)
     start_time = time.time()
-    tenders = scrape_ted_api(MAX_PAGES, USE_CACHE)
+    if REPROCESS:
+        total = reprocess_cache(OUTPUT_PROFILE, verify=VERIFY_BATCH)
+    elif SHARDED:
+        total = scrape_ted_api_sharded(SHARD_BY, SHARD_WORKERS, USE_CACHE,
+                                       PARQUET_DIR if WRITE_PARQUET else None,
+                                       SQLITE_FILE if WRITE_SQLITE else None, profile=OUTPUT_PROFILE)
+    else:
+        total = run_scraper(MAX_PAGES, USE_CACHE, PARQUET_DIR if WRITE_PARQUET else None,
+                            INCREMENTAL, RESUME, SQLITE_FILE if WRITE_SQLITE else None, SKIP_UNCHANGED,
+                            profile=OUTPUT_PROFILE)
     end_time = time.time()
 
-    logger.info(f"数据已保存到: {OUTPUT_FILE}")
+    logger.info(f"共写入 {total} 条记录，数据已保存到: {REPROCESS_FILE if REPROCESS else OUTPUT_FILE}")
     logger.info(f"总执行时间: {end_time - start_time:.2f} 秒")
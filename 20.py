@@ -1,9 +1,31 @@
-import csv  # 用于CSV文件读写
-import time  # 用于时间控制
-import requests  # 用于发送HTTP请求
 import json  # 用于处理JSON数据
 import re  # 用于正则表达式匹配
-from lxml import etree  # 用于HTML/XML解析和XPath查询
+from ted_parser import extract_labels  # 用于单次遍历提取字段
+from ted_fetcher import fetch_details  # 用于并发获取公告详情
+from ted_sink import CsvSink  # 用于追加写入CSV
+import ted_http  # 用于共享会话、限流和退避重试
+from ted_state import WatermarkStore, IncrementalCrawl  # 用于增量抓取
+from ted_schema import label_search_fields, labels_from_search, labels_without_search  # 用于从搜索结果填充详情页字段
+from ted_search import lookup_notices  # 用于按公告编号批量查询
+
+# 详情页并发抓取配置
+DETAIL_WORKERS = 8  # 并发连接数
+REQUESTS_PER_SECOND = 5  # 初始每秒请求数（随服务器响应自适应调整）
+
+# 公告搜索条件（按公告编号降序）
+QUERY = "(classification-cpv IN (44000000 45000000))  SORT BY publication-number DESC"
+WATERMARK_FILE = 'watermarks20.json'  # 增量模式的水位线
+
+# 需要提取的字段名称（CSV表头）
+HEAD = [
+    # 'notice_number'
+    'Official name', 'Legal type of the buyer', 'Country', 'Legal basis', 'Estimated value excluding VAT',
+    'Main classification', 'Duration', 'The procurement is covered by the Government Procurement Agreement (GPA)',
+    'Winner selection status', 'winners_official_name', 'Value of subcontracting',
+    'Date of the conclusion of the contract', 'Publication date'
+]
+# 混合模式：这些字段都能从搜索结果取到时不再请求详情页
+REQUIRED_LABELS = ['Official name', 'Country', 'Main classification', 'Publication date']
 
 
 #通过API获取单个公告的HTML内容
@@ -41,7 +63,7 @@ def raw_data(param):
     }
     try:
         # 发送GET请求获取数据
-        response = requests.get(url, headers=headers, cookies=cookies, params=params)
+        response = ted_http.request('GET', url, headers=headers, cookies=cookies, params=params)
         # 从JSON响应中提取HTML格式的公告内容
         raw = response.json()["noticeAsHtml"]
         return raw
@@ -52,73 +74,44 @@ def raw_data(param):
 #使用XPath解析HTML，提取结构化数据
 def handle_raw(data):
     """解析HTML数据并提取关键字段"""
-    # 定义需要提取的字段名称（CSV表头）
-    head = [
-        # 'notice_number'
-        'Official name', 'Legal type of the buyer', 'Country', 'Legal basis', 'Estimated value excluding VAT',
-        'Main classification', 'Duration', 'The procurement is covered by the Government Procurement Agreement (GPA)',
-        'Winner selection status', 'winners_official_name', 'Value of subcontracting',
-        'Date of the conclusion of the contract', 'Publication date'
-    ]
-
-    res_dic = {}  # 存储解析结果的字典
-    # res_list = []
-    tree = etree.HTML(data)  # 将HTML字符串转换为可查询的XPath树
-
-    for i in head:
-        # 查找包含字段名的span标签，并定位到其父div
-        div = tree.xpath(f"//*[text() = '{i}']/ancestor::div[1]")
-        if div:
-            div = div[0]
-            # 获取div内所有文本
-            aa = div.xpath('.//text()')
-            # 分割文本获取字段值（格式：字段名: 值）
-            b = ''.join(aa).split(': ')[0].strip()
-            # 处理特殊字符并提取值部分
-            c = ''.join(aa).split(': ')[1].strip().replace('\xa0', ' ').replace('\\n', '')
-
-            # 特殊处理：当值不存在时，查找相邻div
-            if b and not c:
-                c = div.xpath('./following-sibling::div[1]/span[1]/text()')[0]
-            res_dic[i] = c
-        else:
-            # 字段未找到时留空
-            res_dic[i] = ''
+    # 单次遍历HTML树定位所有字段所在div并取值（未找到的字段留空）
+    res_dic = extract_labels(data, HEAD)
+    res_dic['source'] = 'detail'
 
     print(res_dic)  # 打印解析结果
     return res_dic
 
+#只用搜索结果填充字段（混合模式）
+def search_row(notice):
+    """从搜索结果构造与 handle_raw 相同的字段，必需字段缺失时返回 None"""
+    values = labels_from_search(notice, HEAD)
+    if any(label not in values for label in REQUIRED_LABELS):
+        return None
+    row = {label: values.get(label, '') for label in HEAD}
+    row['source'] = 'search'
+    return row
 
-first = True  # 标记是否首次写入CSV（用于控制表头）
+
+# 持久打开的CSV输出（追加模式，UTF-8-sig编码解决Excel中文乱码，表头只写一次）
+sink = CsvSink('20.csv', fieldnames=[
+    'notice_number', 'Official name', 'Legal type of the buyer', 'Country', 'Legal basis',
+    'Estimated value excluding VAT',
+    'Main classification', 'Duration',
+    'The procurement is covered by the Government Procurement Agreement (GPA)',
+    'Winner selection status', 'winners_official_name', 'Value of subcontracting',
+    'Date of the conclusion of the contract', 'Publication date', 'source'
+])
 
 #将数据写入CSV文件
 def csv_write(content):
-    global first
     print('正在写入')
     print(content)
 
-    # 打开CSV文件（追加模式，UTF-8-sig编码解决Excel中文乱码）
-    with open('20.csv', 'a', newline='', encoding='utf-8-sig') as f:
-        writer = csv.DictWriter(
-            f, fieldnames=[
-                'notice_number', 'Official name', 'Legal type of the buyer', 'Country', 'Legal basis',
-                'Estimated value excluding VAT',
-                'Main classification', 'Duration',
-                'The procurement is covered by the Government Procurement Agreement (GPA)',
-                'Winner selection status', 'winners_official_name', 'Value of subcontracting',
-                'Date of the conclusion of the contract', 'Publication date'
-            ])
-
-        # 首次写入时添加表头
-        if first:
-            writer.writeheader()
-            first = False
-
-        # 写入数据行
-        writer.writerow(content)
+    # 写入缓冲，按批次追加到文件
+    sink.write(content)
 
 #主爬取函数：获取公告列表并处理详情页
-def get_target_url(targetpage=1):
+def get_target_url(targetpage=1, incremental=False, hybrid=False):
     # 请求头设置
     headers = {
         "accept": "application/json, text/plain, */*",
@@ -143,11 +136,16 @@ def get_target_url(targetpage=1):
     # 公告搜索API
     url = "https://tedweb.api.ted.europa.eu/private-search/api/v1/notices/search"
 
+    # 增量模式：只抓取上次水位线之后的新公告
+    tracker = IncrementalCrawl(WatermarkStore(WATERMARK_FILE), QUERY) if incremental else None
+    if hybrid:
+        print(f"混合模式: 由搜索结果填充的行（source=search）以下字段为空: {', '.join(labels_without_search(HEAD))}")
+
     # 遍历指定页数
     for i in range(targetpage):
         # 构造POST请求的JSON数据
         data = {
-            "query": "(classification-cpv IN (44000000 45000000))  SORT BY publication-number DESC",
+            "query": QUERY,
             "page": i + 1,
             "limit": 50,
             "fields": [
@@ -187,33 +185,100 @@ def get_target_url(targetpage=1):
                 "buyer-country": []
             }
         }
+        if hybrid:
+            # 混合模式额外请求能替代详情页字段的搜索字段
+            data["fields"] += [f for f in label_search_fields(HEAD) if f not in data["fields"]]
         data = json.dumps(data, separators=(',', ':'))  # 序列化为JSON
 
         # 发送POST请求
-        response = requests.post(url, headers=headers, cookies=cookies, data=data)
+        response = ted_http.request('POST', url, headers=headers, cookies=cookies, data=data)
         text = response.text
 
         # 使用正则提取公告编号（格式：数字-数字）
         pat = '"publication-number":.*?"(\d+-\d+)"'
         res = re.findall(pat, text)
+        if tracker:
+            res = tracker.new_items(res, number_of=lambda j: j)
 
-        # 遍历当前页所有公告编号
-        for l, j in enumerate(res):
-            # 获取公告详情页HTML
-            raw = raw_data(j)
+        if hybrid:
+            # 必需字段都能从搜索结果取到的公告直接写入，其余的才请求详情页
+            notices = {n.get('publication-number'): n for n in response.json().get('notices', [])}
+            rest = []
+            for j in res:
+                final_list = search_row(notices.get(j, {}))
+                if final_list:
+                    final_list['notice_number'] = j
+                    csv_write(final_list)
+                else:
+                    rest.append(j)
+            res = rest
+
+        # 并发获取当前页所有公告详情页HTML（按原顺序返回）
+        for j, raw in fetch_details(res, raw_data, DETAIL_WORKERS):
             if raw:
                 # 解析并处理数据
                 final_list = handle_raw(raw)
                 final_list['notice_number'] = j  # 添加公告编号
                 csv_write(final_list)  # 写入CSV
             else:
-                # 失败时记录日志
+                # 失败时记录日志（可用 retry_failed 重新抓取）
                 with open('error.log', 'a', encoding='utf-8') as g:
                     g.write(f'{j}连接失败\n')
-            time.sleep(1)  # 请求间隔防止被封
+                if tracker:
+                    # 有公告抓取失败时不推进水位线，否则之后的增量运行会跳过它
+                    tracker.mark_gap()
+
+        # 已到达上次水位线，后面的页面都是已抓取过的公告
+        if tracker and tracker.reached:
+            break
+
+    if tracker:
+        tracker.finish()
+
+#重新抓取 error.log 中失败的公告
+def retry_errors(error_file='error.log'):
+    """先按编号批量查询搜索API（每个请求包含多个编号），必需字段齐全的直接写入，
+    其余再逐个请求详情页；仍然失败的编号写回 error.log"""
+    try:
+        with open(error_file, 'r', encoding='utf-8') as g:
+            numbers = re.findall(r'(\d+-\d+)连接失败', g.read())
+    except FileNotFoundError:
+        return
+    fields = ['publication-number'] + label_search_fields(HEAD)
+
+    rest = []
+    for j, notice in lookup_notices(numbers, fields):
+        final_list = search_row(notice) if notice else None
+        if final_list:
+            final_list['notice_number'] = j
+            csv_write(final_list)
+        else:
+            rest.append(j)
+
+    failed = []
+    for j, raw in fetch_details(rest, raw_data, DETAIL_WORKERS):
+        if raw:
+            final_list = handle_raw(raw)
+            final_list['notice_number'] = j
+            csv_write(final_list)
+        else:
+            failed.append(j)
+    with open(error_file, 'w', encoding='utf-8') as g:
+        g.writelines(f'{j}连接失败\n' for j in failed)
+
 
 # 主程序入口
 target_package = 1  # 设置爬取页数
+incremental = False  # 增量模式：只抓取上次运行之后发布的公告
+hybrid = False  # 混合模式：必需字段可由搜索结果填充时不请求详情页（其余字段留空，source 列标记为 search）
+retry_failed = False  # 只重新抓取 error.log 中失败的公告
+ted_http.configure_rate_limit(REQUESTS_PER_SECOND)
 
-#主爬虫函数，获取公告列表并调度详情抓取
-get_target_url(target_package)
+try:
+    if retry_failed:
+        retry_errors()
+    else:
+        #主爬虫函数，获取公告列表并调度详情抓取
+        get_target_url(target_package, incremental, hybrid)
+finally:
+    sink.close()  # 写出剩余缓冲（抓取中途出错时也不丢失已缓冲的行）
@@ -1,12 +1,15 @@
-import csv  # 用于CSV文件读写
 import time  # 用于时间控制
-import requests  # 用于发送HTTP请求
 import json  # 用于处理JSON数据
-import re  # 用于正则表达式匹配
 import os  # 用于目录操作
 import logging  # 用于日志记录
-from lxml import etree  # 用于HTML/XML解析和XPath查询
-import pandas as pd  # 用于数据处理和CSV输出
+from ted_parser import extract_labels, parse_pipeline  # 用于单次遍历提取字段和流水线解析
+from concurrent.futures import ProcessPoolExecutor  # 用于多进程解析HTML
+from ted_fetcher import fetch_details  # 用于并发获取公告详情
+from ted_sink import CsvSink  # 用于流式写入CSV
+import ted_http  # 用于共享会话、限流和退避重试
+from ted_cache import DetailCache  # 用于缓存公告详情HTML
+from ted_state import WatermarkStore, IncrementalCrawl, CrawlCheckpoint  # 用于增量抓取和断点续爬
+from ted_schema import label_search_fields, labels_from_search, labels_without_search  # 用于从搜索结果填充详情页字段
 
 # 配置日志系统
 logging.basicConfig(
@@ -23,9 +26,33 @@ logger = logging.getLogger("TEDScraper")
 OUTPUT_DIR = 'data'
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, '21.csv')
 CACHE_DIR = os.path.join(OUTPUT_DIR, 'cache')
+WATERMARK_FILE = os.path.join(OUTPUT_DIR, 'watermarks21.json')  # 增量模式的水位线
+CHECKPOINT_FILE = os.path.join(OUTPUT_DIR, 'checkpoint21.jsonl')  # 断点续爬日志
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# 公告搜索条件（按公告编号降序）
+QUERY = "(classification-cpv IN (44000000 45000000))  SORT BY publication-number DESC"
+
+# 详情页并发抓取配置
+DETAIL_WORKERS = 8  # 并发连接数
+REQUESTS_PER_SECOND = 5  # 初始每秒请求数（随服务器响应自适应调整）
+
+# 流水线模式：抓取线程只负责网络请求，HTML解析交给进程池
+PARSE_PROCESSES = os.cpu_count()  # 解析进程数，设为0时在抓取线程内顺序解析
+PARSE_QUEUE_SIZE = 4 * (os.cpu_count() or 1)  # 在途解析任务上限（背压）
+
+# 需要提取的字段名称（CSV表头）
+HEAD = [
+    # 'notice_number'
+    'Official name', 'Legal type of the buyer', 'Country', 'Legal basis', 'Estimated value excluding VAT',
+    'Main classification', 'Duration', 'The procurement is covered by the Government Procurement Agreement (GPA)',
+    'Winner selection status', 'winners_official_name', 'Value of subcontracting',
+    'Date of the conclusion of the contract', 'Publication date'
+]
+# 混合模式：这些字段都能从搜索结果取到时不再请求详情页
+REQUIRED_LABELS = ['Official name', 'Country', 'Main classification', 'Publication date']
+
 
 # 通过API获取单个公告的HTML内容
 def raw_data(param):
@@ -62,9 +89,9 @@ def raw_data(param):
     }
     try:
         # 发送GET请求获取数据
-        response = requests.get(url, headers=headers,
-                                #cookies=cookies,
-                                params=params, timeout=30)
+        response = ted_http.request('GET', url, headers=headers,
+                                    #cookies=cookies,
+                                    params=params, timeout=30)
         response.raise_for_status()  # 检查HTTP错误
 
         # 从JSON响应中提取HTML格式的公告内容
@@ -78,67 +105,38 @@ def raw_data(param):
 # 使用XPath解析HTML，提取结构化数据
 def handle_raw(data, notice_number):
     """解析HTML数据并提取关键字段"""
-    # 定义需要提取的字段名称（CSV表头）
-    head = [
-        # 'notice_number'
-        'Official name', 'Legal type of the buyer', 'Country', 'Legal basis', 'Estimated value excluding VAT',
-        'Main classification', 'Duration', 'The procurement is covered by the Government Procurement Agreement (GPA)',
-        'Winner selection status', 'winners_official_name', 'Value of subcontracting',
-        'Date of the conclusion of the contract', 'Publication date'
-    ]
-
     res_dic = {
         'notice_id': notice_number,
-        'ted_url': f"https://ted.europa.eu/en/notice/-/detail/{notice_number}"
+        'ted_url': f"https://ted.europa.eu/en/notice/-/detail/{notice_number}",
+        'source': 'detail'
     }  # 存储解析结果的字典
 
-    tree = etree.HTML(data)  # 将HTML字符串转换为可查询的XPath树
-
-    for i in head:
-        # 查找包含字段名的span标签，并定位到其父div
-        div = tree.xpath(f"//*[text() = '{i}']/ancestor::div[1]")
-        if div:
-            if div:
-                div = div[0]
-                # 获取div内所有文本
-                aa = div.xpath('.//text()')
-                # 分割文本获取字段值（格式：字段名: 值）
-                b = ''.join(aa).split(': ')[0].strip()
-                # 处理特殊字符并提取值部分
-                c = ''.join(aa).split(': ')[1].strip().replace('\xa0', ' ').replace('\\n', '')
-
-                # 特殊处理：当值不存在时，查找相邻div
-                if b and not c:
-                    c = div.xpath('./following-sibling::div[1]/span[1]/text()')[0]
-                res_dic[i] = c
-            else:
-                # 字段未找到时留空
-                res_dic[i] = ''
-
-        #print(res_dic)  # 打印解析结果
-        #return res_dic
+    # 单次遍历HTML树定位所有字段所在div并取值（未找到的字段留空）
+    res_dic.update(extract_labels(data, HEAD))
 
     logger.info(f"解析公告 {notice_number} 完成")
     return res_dic
 
 
-# 保存数据到CSV文件
-def save_to_csv(data, filename):
-    """保存数据到CSV"""
-    if not data:
-        logger.warning("没有数据可保存")
-        return
-
-    # 转换为DataFrame
-    df = pd.DataFrame(data)
-
-    # 保存到CSV（使用UTF-8-sig编码解决Excel中文乱码）
-    df.to_csv(filename, index=False, encoding='utf-8-sig')
-    logger.info(f"已保存 {len(df)} 条记录到 {filename}")
+# 只用搜索结果填充字段（混合模式）
+def search_row(notice, notice_number):
+    """从搜索结果构造与 handle_raw 相同列的记录，必需字段缺失时返回 None"""
+    values = labels_from_search(notice, HEAD)
+    if any(label not in values for label in REQUIRED_LABELS):
+        return None
+    res_dic = {
+        'notice_id': notice_number,
+        'ted_url': f"https://ted.europa.eu/en/notice/-/detail/{notice_number}",
+        'source': 'search'
+    }
+    res_dic.update({label: values.get(label, '') for label in HEAD})
+    return res_dic
 
 
-# 主爬取函数：获取公告列表并处理详情页
-def get_target_url(targetpage=1):
+# 抓取流水线：获取公告列表并处理详情页，逐条产出已写入输出的公告数据
+def iter_tenders(targetpage=1, parse_processes=PARSE_PROCESSES, incremental=False, resume=False, hybrid=False):
+    """每页的公告写入CSV并记录检查点后才产出，内存中最多只保留一页的数据；
+    调用方提前停止迭代时输出正常关闭，检查点保留（可续爬），增量模式不推进水位线"""
     # 请求头设置
     headers = {
         "accept": "application/json, text/plain, */*",
@@ -163,88 +161,170 @@ def get_target_url(targetpage=1):
     # 公告搜索API
     url = "https://tedweb.api.ted.europa.eu/private-search/api/v1/notices/search"
 
-    all_tenders = []  # 存储所有公告数据
-
-    # 遍历指定页数
-    for i in range(targetpage):
-        # 构造POST请求的JSON数据
-        data = {
-            "query": "(classification-cpv IN (44000000 45000000))  SORT BY publication-number DESC",
-            "page": i + 1,
-            "limit": 50,
-            "fields": [
-                "publication-number",
-                "BT-5141-Procedure",
-                "BT-5141-Part",
-                "BT-5141-Lot",
-                "BT-5071-Procedure",
-                "BT-5071-Part",
-                "BT-5071-Lot",
-                "BT-727-Procedure",
-                "BT-727-Part",
-                "BT-727-Lot",
-                "place-of-performance",
-                "procedure-type",
-                "contract-nature",
-                "buyer-name",
-                "buyer-country",
-                "publication-date",
-                "deadline-receipt-request",
-                "notice-title",
-                "official-language",
-                "notice-type",
-                "change-notice-version-identifier"
-            ],
-            "validation": False,
-            "scope": "ALL",
-            "language": "EN",
-            "onlyLatestVersions": True,
-            "facets": {
-                "business-opportunity": [],
-                "cpv": [],
-                "contract-nature": [],
-                "place-of-performance": [],
-                "procedure-type": [],
-                "publication-date": [],
-                "buyer-country": []
+    total = 0  # 已写入的公告数
+    # 本次运行的输出文件只打开一次，每页数据追加写入（UTF-8-sig编码解决Excel中文乱码）
+    # 增量模式或断点续爬时追加到已有输出，否则覆盖
+    sink = CsvSink(OUTPUT_FILE, append=(incremental or resume))
+    # 检查点：resume=True 时跳过上次已完成的页面和公告
+    checkpoint = CrawlCheckpoint(CHECKPOINT_FILE, resume=resume)
+    completed = True
+    tracker = IncrementalCrawl(WatermarkStore(WATERMARK_FILE), QUERY) if incremental else None
+    executor = ProcessPoolExecutor(max_workers=parse_processes) if parse_processes else None
+    detail_cache = DetailCache(CACHE_DIR)  # 详情HTML缓存，重复运行时直接读盘
+    from_search = 0  # 混合模式下直接由搜索结果填充的公告数
+    if hybrid:
+        logger.warning(f"混合模式: 由搜索结果填充的行（source=search）以下字段为空: "
+                       f"{', '.join(labels_without_search(HEAD))}")
+
+    stopped = True  # 调用方提前停止迭代时保持 True
+    try:
+        # 遍历指定页数
+        for i in range(targetpage):
+            if checkpoint.page_done(i + 1):
+                logger.info(f"第 {i + 1} 页已在检查点中完成，跳过")
+                continue
+            checkpoint.start_page(i + 1)
+            done_ids = []  # 本页成功写入的公告
+            page_tenders = []  # 本页写入的公告数据（记录检查点后产出）
+            page_ok = True
+
+            # 构造POST请求的JSON数据
+            data = {
+                "query": QUERY,
+                "page": i + 1,
+                "limit": 50,
+                "fields": [
+                    "publication-number",
+                    "BT-5141-Procedure",
+                    "BT-5141-Part",
+                    "BT-5141-Lot",
+                    "BT-5071-Procedure",
+                    "BT-5071-Part",
+                    "BT-5071-Lot",
+                    "BT-727-Procedure",
+                    "BT-727-Part",
+                    "BT-727-Lot",
+                    "place-of-performance",
+                    "procedure-type",
+                    "contract-nature",
+                    "buyer-name",
+                    "buyer-country",
+                    "publication-date",
+                    "deadline-receipt-request",
+                    "notice-title",
+                    "official-language",
+                    "notice-type",
+                    "change-notice-version-identifier"
+                ],
+                "validation": False,
+                "scope": "ALL",
+                "language": "EN",
+                "onlyLatestVersions": True,
+                "facets": {
+                    "business-opportunity": [],
+                    "cpv": [],
+                    "contract-nature": [],
+                    "place-of-performance": [],
+                    "procedure-type": [],
+                    "publication-date": [],
+                    "buyer-country": []
+                }
             }
-        }
-        data_json = json.dumps(data, separators=(',', ':'))  # 序列化为JSON
-
-        try:
-            # 发送POST请求
-            logger.info(f"获取第 {i + 1} 页数据...")
-            response = requests.post(url, headers=headers, #cookies=cookies,
-                                      data=data_json, timeout=30)
-            response.raise_for_status()  # 检查HTTP错误
-            text = response.text
-
-            # 使用正则提取公告编号（格式：数字-数字）
-            pat = '"publication-number":.*?"(\d+-\d+)"'
-            res = re.findall(pat, text)
-            logger.info(f"第 {i + 1} 页找到 {len(res)} 个公告")
-
-            # 遍历当前页所有公告编号
-            for j in res:
-                # 获取公告详情页HTML
-                raw = raw_data(j)
-                if raw:
-                    # 解析并处理数据
-                    tender_data = handle_raw(raw, j)
-                    all_tenders.append(tender_data)
-                else:
-                    # 失败时记录日志
-                    logger.error(f"公告 {j} 获取失败")
-                time.sleep(1)  # 请求间隔防止被封
-        except Exception as e:
-            logger.error(f"获取第 {i + 1} 页数据失败: {str(e)}")
-
-        # 每处理完一页就保存一次数据
-        if all_tenders:
-            save_to_csv(all_tenders, OUTPUT_FILE)
-        time.sleep(2)  # 页间延迟
-
-    logger.info(f"爬取完成! 共获取 {len(all_tenders)} 条记录")
+            if hybrid:
+                # 混合模式额外请求能替代详情页字段的搜索字段
+                data["fields"] += [f for f in label_search_fields(HEAD) if f not in data["fields"]]
+            data_json = json.dumps(data, separators=(',', ':'))  # 序列化为JSON
+
+            try:
+                # 发送POST请求
+                logger.info(f"获取第 {i + 1} 页数据...")
+                response = ted_http.request('POST', url, headers=headers, #cookies=cookies,
+                                            data=data_json, timeout=30)
+                response.raise_for_status()  # 检查HTTP错误
+                notices = response.json().get('notices', [])
+
+                # 提取公告编号及其版本号（版本号用作详情缓存键）
+                by_id = {n.get('publication-number'): n for n in notices if n.get('publication-number')}
+                versions = {j: n.get('change-notice-version-identifier', '') for j, n in by_id.items()}
+                res = list(versions)
+                if tracker:
+                    res = tracker.new_items(res, number_of=lambda j: j)
+                res = [j for j in res if not checkpoint.notice_done(j)]
+                logger.info(f"第 {i + 1} 页找到 {len(res)} 个公告")
+
+                if hybrid:
+                    # 必需字段都能从搜索结果取到的公告直接写入，其余的才请求详情页
+                    rest = []
+                    for j in res:
+                        tender_data = search_row(by_id[j], j)
+                        if tender_data:
+                            page_tenders.append(tender_data)
+                            sink.write(tender_data)
+                            done_ids.append(j)
+                            from_search += 1
+                        else:
+                            rest.append(j)
+                    res = rest
+
+                # 并发获取当前页所有公告详情页HTML，边下载边交给解析进程（按原顺序返回）
+                fetched = fetch_details(res, lambda j: detail_cache.fetch(j, versions[j], raw_data), DETAIL_WORKERS)
+                for j, tender_data in parse_pipeline(fetched, handle_raw, executor, PARSE_QUEUE_SIZE):
+                    if tender_data:
+                        page_tenders.append(tender_data)
+                        sink.write(tender_data)
+                        done_ids.append(j)
+                    else:
+                        # 失败时记录日志
+                        logger.error(f"公告 {j} 获取或解析失败")
+                        page_ok = False
+            except Exception as e:
+                logger.error(f"获取第 {i + 1} 页数据失败: {str(e)}")
+                page_ok = False
+
+            # 每处理完一页就把缓冲写到磁盘，然后记录检查点
+            # （有失败公告的页面不标记完成，续爬时重新抓取其中未完成的公告）
+            sink.flush()
+            if page_ok:
+                checkpoint.complete_page(i + 1, done_ids)
+            else:
+                checkpoint.complete_notices(done_ids)
+                completed = False
+                if tracker:
+                    # 有公告获取或解析失败时不推进水位线，否则之后的增量运行会把它当作已入库而永久丢失
+                    tracker.mark_gap()
+            total += len(page_tenders)
+            yield from page_tenders
+
+            # 已到达上次水位线，后面的页面都是已抓取过的公告
+            if tracker and tracker.reached:
+                logger.info(f"第 {i + 1} 页已到达上次水位线，停止翻页")
+                break
+        stopped = False
+    finally:
+        if stopped:
+            completed = False
+            if tracker:
+                tracker.mark_gap()
+        if tracker:
+            tracker.finish()
+        sink.close()
+        if completed:
+            checkpoint.finish()
+        else:
+            checkpoint.close()
+            logger.info(f"有页面或公告未完成，可设置 resume=True 从检查点继续: {CHECKPOINT_FILE}")
+        if executor:
+            executor.shutdown()
+        detail_cache.log_stats()
+        if hybrid:
+            logger.info(f"混合模式: {from_search} 个公告由搜索结果直接填充")
+        logger.info(f"爬取完成! 共获取 {total} 条记录")
+
+
+# 主爬取函数：获取公告列表并处理详情页
+def get_target_url(targetpage=1, parse_processes=PARSE_PROCESSES, incremental=False, resume=False, hybrid=False):
+    """运行整个抓取流水线，返回写入的公告数"""
+    return sum(1 for _ in iter_tenders(targetpage, parse_processes, incremental, resume, hybrid))
 
 
 # 主程序入口
@@ -257,7 +337,11 @@ if __name__ == "__main__":
 
     start_time = time.time()
     target_pages = 1  # 设置爬取页数
-    get_target_url(target_pages)
+    incremental = False  # 增量模式：只抓取上次运行之后发布的公告
+    resume = False  # 从上次中断的检查点继续
+    hybrid = False  # 混合模式：必需字段可由搜索结果填充时不请求详情页（其余字段留空，source 列标记为 search）
+    ted_http.configure_rate_limit(REQUESTS_PER_SECOND)
+    get_target_url(target_pages, incremental=incremental, resume=resume, hybrid=hybrid)
     end_time = time.time()
 
     logger.info(f"总执行时间: {end_time - start_time:.2f} 秒")
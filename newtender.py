@@ -1,11 +1,17 @@
-import requests
-import json
 import pandas as pd
 import os
 import time
+import itertools
 import logging
-from pathlib import Path
 from tqdm import tqdm
+import ted_http
+from ted_sink import ParquetSink, SqliteSink
+from ted_cache import SearchCache
+from ted_state import WatermarkStore, IncrementalCrawl, ChangeIndex
+from ted_search import Paginator, PAGINATION_AUTO, stream_search_response, pagination_mode, cache_payload
+from ted_schema import OutputSchema, lot_key
+from ted_fields import Field, FIRST, TEXT_FIRST_ITEM, TEXT_PREFERRED, compile_fields
+import ted_table
 
 # 配置日志系统
 logging.basicConfig(
@@ -22,11 +28,61 @@ logger = logging.getLogger("TEDScraper")
 OUTPUT_DIR = 'data'
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'ted_tenders_with_lots.csv')
 CACHE_DIR = os.path.join(OUTPUT_DIR, 'cache')
+CACHE_TTL = 6 * 3600  # 搜索页缓存有效期（秒）
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # 搜索页缓存总大小上限
+PARQUET_DIR = os.path.join(OUTPUT_DIR, 'parquet_lots')  # 按发布日期分区的列式输出
+WATERMARK_FILE = os.path.join(OUTPUT_DIR, 'watermarks_lots.json')  # 增量模式的水位线
+CHANGE_INDEX_FILE = os.path.join(OUTPUT_DIR, 'fingerprints_lots.bin')  # 公告指纹索引（变更检测）
+SQLITE_FILE = os.path.join(OUTPUT_DIR, 'ted_lots.db')  # 按 (公告编号, 标段编号) upsert 的SQLite库
+PAGINATION_MODE = PAGINATION_AUTO  # 分页方式：优先游标分页，不支持时退回页码
+REPROCESS_FILE = os.path.join(OUTPUT_DIR, 'ted_tenders_with_lots_cached.csv')  # 从缓存归档重新提取的结果
+REPROCESS_BATCH = 5000  # 批量提取每批的公告数
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(CACHE_DIR, exist_ok=True)
 
 # API 配置
+QUERY = "(classification-cpv IN (44000000 45000000))  SORT BY publication-number DESC"
 API_URL = 'https://tedweb.api.ted.europa.eu/private-search/api/v1/notices/search'
+# 标段行的输出schema：列名 -> 依赖的API字段
+LOT_SCHEMA = OutputSchema([
+    ('notice_id', ['publication-number']),
+    ('business_opportunity', ['notice-type']),
+    ('publication_date', ['publication-date']),
+    ('buyer_official_name', ['buyer-name']),
+    ('buyer_country', ['buyer-country']),
+    ('purpose_cpv', ['cpv']),
+    ('place_country', ['place-of-performance']),
+    ('total_value', ['estimated-value']),
+    ('lot_id', ['lots']),
+    ('lot_number', ['lots']),
+    ('lot_title', ['lots']),
+    ('lot_purpose_cpv', ['lots']),
+    ('lot_place_country', ['lots']),
+    ('lot_estimated_duration', ['lots']),
+    ('lot_value', ['lots']),
+    ('winner_status', ['lots']),
+    ('winner_name', ['lots']),
+    ('contract_value', ['lots']),
+    ('contract_date', ['lots']),
+], required_fields=['publication-number', 'change-notice-version-identifier'], profiles={
+    # 每个公告一行，不请求标段
+    'notice': ['notice_id', 'business_opportunity', 'publication_date', 'buyer_official_name',
+               'buyer_country', 'purpose_cpv', 'place_country', 'total_value'],
+    # 中标结果
+    'awards': ['notice_id', 'publication_date', 'buyer_official_name', 'buyer_country',
+               'lot_id', 'lot_title', 'winner_status', 'winner_name', 'contract_value', 'contract_date'],
+}, categorical=['business_opportunity', 'buyer_official_name', 'buyer_country', 'winner_status'])
+OUTPUT_PROFILE = 'full'  # 输出的列组合（决定请求哪些字段）
+# 公告级和标段级多语言字段的取值声明（导入时编译成取值函数）
+NOTICE_FIELDS = compile_fields({
+    'business_opportunity': Field('notice-type', 'label'),
+    'buyer_official_name': Field('buyer-name', text=TEXT_FIRST_ITEM),
+    'buyer_country': Field('buyer-country', FIRST, 'label'),
+})
+LOT_FIELDS = compile_fields({
+    'lot_id': Field(('id', 'lotIdentifier', 'lot-identifier')),
+    'lot_title': Field('title', text=TEXT_PREFERRED, prefer='eng'),
+})
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
     'Content-Type': 'application/json',
@@ -36,94 +92,62 @@ HEADERS = {
 }
 
 
-def create_payload(page_number=1, page_size=50):
-    return {
-        "query": "(classification-cpv IN (44000000 45000000))  SORT BY publication-number DESC",
+def create_payload(page_number=1, page_size=50, pagination=None, columns=None):
+    payload = {
+        "query": QUERY,
         "page": page_number,
         "limit": page_size,
-        "fields": [
-            "publication-number",
-            "BT-5141-Procedure",
-            "BT-5141-Part",
-            "BT-5141-Lot",
-            "BT-5071-Procedure",
-            "BT-5071-Part",
-            "BT-5071-Lot",
-            "BT-727-Procedure",
-            "BT-727-Part",
-            "BT-727-Lot",
-            "place-of-performance",
-            "procedure-type",
-            "contract-nature",
-            "buyer-name",
-            "buyer-country",
-            "publication-date",
-            "deadline-receipt-request",
-            "notice-title",
-            "official-language",
-            "notice-type",
-            "change-notice-version-identifier"
-        ],
+        "fields": LOT_SCHEMA.fields(columns),  # 只请求输出列需要的字段
         "validation": False,
         "scope": "ALL",
         "language": "EN",
         "onlyLatestVersions": True,
-        "facets": {
-            "business-opportunity": [],
-            "cpv": [],
-            "contract-nature": [],
-            "place-of-performance": [],
-            "procedure-type": [],
-            "publication-date": [],
-            "buyer-country": []
-        }
+        "facets": {}  # 不需要分面统计
     }
+    if pagination:
+        # 游标分页时用分页字段替换页码
+        payload.pop("page")
+        payload.update(pagination)
+    return payload
 
 
-def get_cache_file_path(page_number):
-    """获取缓存文件路径"""
-    return Path(CACHE_DIR) / f'ted_api_page_{page_number}.json'
+# 搜索页缓存（键为完整请求体的哈希，带有效期和容量上限）
+search_cache = SearchCache(CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES)
 
 
-def load_from_cache(page_number):
+def load_from_cache(payload):
     """从缓存加载数据"""
-    cache_file = get_cache_file_path(page_number)
-    if cache_file.exists():
-        try:
-            logger.info(f"从缓存加载第 {page_number} 页数据")
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"加载缓存失败: {str(e)}")
-    return None
-
-
-def save_to_cache(data, page_number):
-    """保存数据到缓存"""
+    data = search_cache.get(payload)
+    if data:
+        logger.info(f"从缓存加载第 {payload['page']} 页数据")
+    return data
+
+
+def save_to_cache(data, payload, page_number=1):
+    """保存数据到缓存（公告在被迭代时逐条写入，整页迭代完后写入页面清单）"""
     if not data:
-        return
+        return data
 
-    cache_file = get_cache_file_path(page_number)
-    try:
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        logger.info(f"数据已缓存: {cache_file}")
-    except Exception as e:
-        logger.error(f"缓存保存失败: {str(e)}")
+    # 游标分页的请求体含一次性令牌，页面清单按不含令牌的请求体和页序号保存（用于LRU和保留归档的公告）
+    data['notices'] = search_cache.put_iter(payload, data.get('notices', []), data,
+                                            key_payload=cache_payload(payload, page_number))
+    return data
 
 
-def fetch_tenders(session, page_number=1, use_cache=True):
+def fetch_tenders(session, page_number=1, use_cache=True, pagination=None, columns=None):
     """从API获取招标数据"""
+    payload = create_payload(page_number, pagination=pagination, columns=columns)
+    # 游标令牌有时效，游标分页的页面不走缓存
+    use_cache = use_cache and 'paginationMode' not in payload
+
     if use_cache:
-        cached_data = load_from_cache(page_number)
+        cached_data = load_from_cache(payload)
         if cached_data:
             return cached_data
 
-    payload = create_payload(page_number)
-
     try:
         logger.info(f"请求第 {page_number} 页数据...")
-        response = session.post(API_URL, json=payload, headers=HEADERS)
+        response = ted_http.request('POST', API_URL, session=session, json=payload, headers=HEADERS, stream=True)
 
         # 详细记录错误信息
         if response.status_code != 200:
@@ -136,10 +160,10 @@ def fetch_tenders(session, page_number=1, use_cache=True):
             logger.error(error_msg)
             return None
 
-        data = response.json()
-        logger.info(f"成功获取第 {page_number} 页数据，包含 {len(data.get('notices', []))} 条记录")
-        save_to_cache(data, page_number)
-        return data
+        # 公告在迭代时才逐条解码，提取与下载重叠进行
+        data = stream_search_response(response)
+        logger.info(f"开始接收第 {page_number} 页数据")
+        return save_to_cache(data, payload, page_number)
     except Exception as e:
         logger.error(f"请求异常: {str(e)}")
         return None
@@ -148,9 +172,9 @@ def fetch_tenders(session, page_number=1, use_cache=True):
 def extract_lot_info(lot_data):
     """提取标段信息"""
     lot_info = {
-        'lot_id': lot_data.get('id', ''),
+        'lot_id': LOT_FIELDS['lot_id'](lot_data),
         'lot_number': lot_data.get('number', ''),
-        'lot_title': '',
+        'lot_title': LOT_FIELDS['lot_title'](lot_data),
         'lot_purpose_cpv': '',
         'lot_place_country': '',
         'lot_estimated_duration': '',
@@ -161,16 +185,6 @@ def extract_lot_info(lot_data):
         'contract_date': ''
     }
 
-    # 提取标段标题
-    title = lot_data.get('title', {})
-    if title:
-        lot_info['lot_title'] = title.get('eng', '')
-        if not lot_info['lot_title']:
-            for text in title.values():
-                if text:
-                    lot_info['lot_title'] = text
-                    break
-
     # 提取CPV分类
     cpv_list = lot_data.get('cpv', [])
     if cpv_list:
@@ -221,27 +235,13 @@ def extract_tender_info(notice):
     """提取招标公告基本信息"""
     tender = {
         'notice_id': notice.get('publication-number', ''),
-        'business_opportunity': notice.get('notice-type', {}).get('label', ''),
         'publication_date': notice.get('publication-date', ''),
-        'buyer_official_name': '',
-        'buyer_country': '',
         'purpose_cpv': '',
         'place_country': '',
         'total_value': ''
     }
-
-    # 提取采购方名称
-    buyer_name = notice.get('buyer-name', {})
-    if buyer_name:
-        for names in buyer_name.values():
-            if names and names:
-                tender['buyer_official_name'] = names[0]
-                break
-
-    # 提取采购方国家
-    buyer_country = notice.get('buyer-country', [])
-    if buyer_country:
-        tender['buyer_country'] = buyer_country[0].get('label', '') if buyer_country else ''
+    # 公告类型、采购方名称和国家由编译好的取值函数提取
+    NOTICE_FIELDS.extract(notice, tender)
 
     # 提取CPV分类
     cpv_list = notice.get('cpv', [])
@@ -259,48 +259,101 @@ def extract_tender_info(notice):
                 countries.append(country.get('label', ''))
         tender['place_country'] = ', '.join(countries)
 
-    # 提取总价值
+    # 提取总价值（搜索API返回列表时取第一个）
     value = notice.get('estimated-value', {})
+    if isinstance(value, list):
+        value = value[0] if value else {}
     if value:
         tender['total_value'] = value.get('amount', '')
 
     return tender
 
 
-def process_notice(notice):
-    """处理单条公告，生成标段数据行"""
-    base_info = extract_tender_info(notice)
-    all_lots = []
+def process_notice(notice, columns=None):
+    """处理单条公告，生成标段数据行；指定 columns 时只输出这些列，不需要标段列时每个公告一行"""
+    layout = LOT_SCHEMA.layout(columns)
+    # 同一公告的标段行共享公告级的值
+    common = layout.common(extract_tender_info(notice))
 
     # 提取标段信息
-    lots = notice.get('lots', [])
+    lots = notice.get('lots', []) if layout.lot_columns else []
 
     if lots:
-        for lot in lots:
+        rows = []
+        for position, lot in enumerate(lots):
+            # 没有标段标识时按位置编号，避免同一公告的标段行主键相同
             lot_info = extract_lot_info(lot)
-            combined = {**base_info, **lot_info}
-            all_lots.append(combined)
-    else:
-        # 没有标段时，只添加基础信息
-        base_info.update({
-            'lot_id': '',
-            'lot_number': '',
-            'lot_title': '',
-            'lot_purpose_cpv': '',
-            'lot_place_country': '',
-            'lot_estimated_duration': '',
-            'lot_value': '',
-            'winner_status': '',
-            'winner_name': '',
-            'contract_value': '',
-            'contract_date': ''
-        })
-        all_lots.append(base_info)
-
-    return all_lots
-
-
-def save_data(data, filename):
+            lot_info['lot_id'] = lot_key(lot_info['lot_id'], position)
+            rows.append(layout.row(common, lot_info))
+        return rows
+    # 没有标段时，只添加基础信息（标段列为空）
+    return [layout.row(common, {})]
+
+
+def process_page_table(notices, columns=None):
+    """把一批公告一次性展开成标段级的表，结果与逐条调用 process_notice 相同"""
+    columns = LOT_SCHEMA.select(columns)
+    notices = list(notices)
+    frame = ted_table.field_columns(notices, LOT_SCHEMA.fields(columns))
+    empty = [None] * len(notices)
+
+    def codes(value):
+        return ', '.join(cpv.get('code', '') for cpv in value) if value else ''
+
+    def countries(value):
+        return ', '.join(place['country'].get('label', '') for place in value if place.get('country')) if value else ''
+
+    def amount(value):
+        if isinstance(value, list):
+            value = value[0] if value else {}
+        return value.get('amount', '') if value else ''
+
+    def column(field, func):
+        return [func(v) for v in frame.get(field, empty)]
+
+    common = {
+        'notice_id': column('publication-number', lambda v: '' if v is None else v),
+        'publication_date': column('publication-date', lambda v: '' if v is None else v),
+        'purpose_cpv': column('cpv', codes),
+        'place_country': column('place-of-performance', countries),
+        'total_value': column('estimated-value', amount),
+    }
+    # 多语言字段按列调用编译好的取值函数
+    for name, accessor in NOTICE_FIELDS.items():
+        if name in columns:
+            common[name] = [accessor(notice) for notice in notices]
+    common = {name: values for name, values in common.items() if name in columns}
+
+    # 按标段展开（没有标段的公告对应一个空标段），公告级的列按位置广播
+    index, offsets, lots = ted_table.explode(frame.get('lots', empty))
+    table = ted_table.broadcast(common, index)
+    if not LOT_SCHEMA.needs('lots', columns):
+        return ted_table.categorize(table[columns], LOT_SCHEMA.categorical)
+
+    winner = ted_table.first_of(ted_table.pluck(lots, 'contractors', []))
+    table['lot_id'] = [LOT_FIELDS['lot_id'](lot) if position < 0 else lot_key(LOT_FIELDS['lot_id'](lot), position)
+                       for lot, position in zip(lots, offsets.tolist())]
+    table['lot_number'] = ted_table.pluck(lots, 'number')
+    table['lot_title'] = [LOT_FIELDS['lot_title'](lot) for lot in lots]
+    table['lot_purpose_cpv'] = [codes(v) for v in ted_table.pluck(lots, 'cpv', [])]
+    table['lot_place_country'] = [countries(v) for v in ted_table.pluck(lots, 'place', [])]
+    table['lot_estimated_duration'] = [v.get('description', '') if v else '' for v in ted_table.pluck(lots, 'duration', {})]
+    table['lot_value'] = [v.get('amount', '') if v else '' for v in ted_table.pluck(lots, 'value', {})]
+    table['winner_status'] = [('Awarded' if w.get('awarded') else 'Pending') if w else '' for w in winner]
+    table['winner_name'] = ted_table.pluck(winner, 'name')
+    table['contract_value'] = [v.get('amount', '') if v else '' for v in ted_table.pluck(winner, 'value', {})]
+    table['contract_date'] = [v if v else '' for v in ted_table.pluck(winner, 'awardDate')]
+    return ted_table.categorize(table[columns].astype(object), LOT_SCHEMA.categorical)
+
+
+def check_page_table(notices, columns=None):
+    """检查批量提取与逐条 process_notice 的结果是否一致（并比较耗时）"""
+    columns = LOT_SCHEMA.select(columns)
+    return ted_table.compare_extraction(notices, lambda n: process_notice(n, columns),
+                                        lambda ns: process_page_table(ns, columns), columns)
+
+
+def save_data(data, filename, append=False, columns=None):
     """保存数据到CSV文件"""
     if not data:
         logger.warning("没有数据可保存")
@@ -309,68 +362,196 @@ def save_data(data, filename):
     # 确保目录存在
     os.makedirs(os.path.dirname(filename), exist_ok=True)
 
-    # 转换为DataFrame
-    df = pd.DataFrame(data)
+    # 行（LotRow 或字典）只在写出时按列顺序转换成DataFrame，重复度高的列用分类类型
+    columns = list(columns) if columns else list(data[0].keys())
+    df = pd.DataFrame([[row.get(col) for col in columns] for row in data], columns=columns)
+    df = ted_table.categorize(df, LOT_SCHEMA.categorical)
 
-    # 保存到CSV
-    df.to_csv(filename, index=False, encoding='utf-8-sig')
+    # 保存到CSV（追加时已有文件不再写表头）
+    mode = 'a' if append else 'w'
+    header = not (append and os.path.exists(filename))
+    df.to_csv(filename, mode=mode, header=header, index=False, encoding='utf-8-sig')
     logger.info(f"已保存 {len(df)} 条记录到 {filename}")
     return df
 
 
-def scrape_ted_api(max_pages=5, use_cache=True, delay=2):
-    """主爬取函数"""
-    all_tenders = []
-    session = requests.Session()
+def iter_tenders(max_pages=5, use_cache=True, *, rate_limit=None, parquet_dir=None, incremental=False,
+                 sqlite_path=None, skip_unchanged=False, pagination=PAGINATION_MODE, profile=OUTPUT_PROFILE):
+    """抓取流水线：页面 → 公告 → 标段行 → 输出，逐行产出已写入输出的标段行
+
+    每页的行追加写入CSV和各输出后才产出，内存中最多只保留一页的行；
+    调用方提前停止迭代时输出正常关闭，增量模式不推进水位线。
+    """
+    columns = LOT_SCHEMA.select(profile)
+    if rate_limit:
+        ted_http.configure_rate_limit(rate_limit)
+
+    total_rows = 0
+    completed = False
+    parquet_sink = (ParquetSink(parquet_dir, columns=columns, categorical_columns=LOT_SCHEMA.categorical,
+                                append=incremental or skip_unchanged) if parquet_dir else None)
+    sqlite_sink = SqliteSink(sqlite_path, columns=columns, key_columns=('notice_id', 'lot_id'),
+                             index_columns=('buyer_country', 'purpose_cpv', 'publication_date')) if sqlite_path else None
+    # 变更检测：版本号和内容都未变化的公告不再提取和输出
+    change_index = ChangeIndex(CHANGE_INDEX_FILE) if skip_unchanged else None
+    # 增量模式：只抓取上次水位线之后的新公告，并追加到已有输出
+    tracker = IncrementalCrawl(WatermarkStore(WATERMARK_FILE), QUERY) if incremental else None
+    session = ted_http.get_session()
     session.headers.update(HEADERS)
 
     logger.info(f"开始爬取TED数据，计划获取 {max_pages} 页...")
 
-    for page in tqdm(range(1, max_pages + 1), desc="处理页面"):
-        # 获取API数据
-        data = fetch_tenders(session, page, use_cache=use_cache)
-
-        if not data:
-            logger.error(f"第 {page} 页数据获取失败，跳过")
-            continue
-
-        notices = data.get('notices', [])
-
-        if not notices:
-            logger.warning(f"第 {page} 页没有公告数据")
-            continue
-
-        # 处理本页所有公告
-        page_tenders = []
-        for notice in notices:
-            try:
-                tender_rows = process_notice(notice)
-                page_tenders.extend(tender_rows)
-            except Exception as e:
-                logger.error(f"处理公告失败: {str(e)}")
-
-        logger.info(f"第 {page} 页提取了 {len(page_tenders)} 条记录")
-        all_tenders.extend(page_tenders)
-
-        # 页面间延迟
-        if page < max_pages:
-            time.sleep(delay)
-
-    # 保存最终结果
-    if all_tenders:
-        df = save_data(all_tenders, OUTPUT_FILE)
-        logger.info(f"爬取完成! 共获取 {len(all_tenders)} 条记录")
-        return df
-    else:
-        logger.warning("没有获取到任何数据")
-        return pd.DataFrame()
+    # 页码分页时失败的页面跳过继续翻页；游标分页无法跳过，失败即停止
+    # 启用缓存时 AUTO 模式使用页码分页（游标分页的页面无法从缓存读取）
+    paginator = Paginator(lambda page, params: fetch_tenders(session, page, use_cache, params, columns),
+                          mode=pagination_mode(pagination, use_cache))
+    try:
+        for page, data in tqdm(paginator.pages(max_pages, stop_on_error=False), total=max_pages, desc="处理页面"):
+            # 公告逐条经过过滤和提取，整页的原始JSON不会同时留在内存中
+            notices = data.get('notices', [])
+
+            if tracker:
+                notices = tracker.iter_new(notices)
+            if change_index:
+                notices = (n for n in notices if change_index.changed(n))
+
+            # 处理本页所有公告
+            page_tenders = []
+            page_ids = []  # 提取成功的公告（只有它们的指纹会被记录，失败的下次仍会重新处理）
+            for notice in notices:
+                try:
+                    tender_rows = process_notice(notice, columns)
+                    page_tenders.extend(tender_rows)
+                except Exception as e:
+                    logger.error(f"处理公告失败: {str(e)}")
+                    continue
+                page_ids.append(notice.get('publication-number'))
+                if change_index:
+                    change_index.stage(notice.get('publication-number'))
+
+            logger.info(f"第 {page} 页提取了 {len(page_tenders)} 条记录")
+            # 只输出增量时（增量模式、变更检测）第一页也追加到已有文件
+            if page_tenders:
+                save_data(page_tenders, OUTPUT_FILE, append=(incremental or skip_unchanged or total_rows > 0),
+                          columns=columns)
+            if sqlite_sink:
+                sqlite_sink.write_rows(page_tenders)
+                if change_index:
+                    sqlite_sink.flush()
+            if parquet_sink:
+                # Parquet跨页缓冲、按批次写盘，只记录行已全部落盘的页面
+                parquet_sink.write_rows(page_tenders)
+                parquet_sink.mark(page_ids)
+                flushed = parquet_sink.take_flushed()
+            else:
+                flushed = [page_ids]
+            if change_index:
+                # 指纹只在各输出都落盘后写入，崩溃时不会把未写出的公告记为未变化
+                for ids in flushed:
+                    change_index.commit(ids)
+
+            total_rows += len(page_tenders)
+            yield from page_tenders
+
+            if tracker and tracker.reached:
+                logger.info(f"第 {page} 页已到达上次水位线，停止翻页")
+                break
+        completed = True
+    finally:
+        if paginator.failed:
+            logger.error("部分页面数据获取失败")
+        if tracker and (not completed or paginator.failed or paginator.gaps):
+            tracker.mark_gap()
+        if tracker:
+            tracker.finish()
+        if sqlite_sink:
+            sqlite_sink.close()
+        if parquet_sink:
+            parquet_sink.close()
+            if change_index:
+                for ids in parquet_sink.take_flushed():
+                    change_index.commit(ids)
+        if change_index:
+            change_index.close()
+        if total_rows:
+            logger.info(f"爬取完成! 共获取 {total_rows} 条记录")
+        else:
+            logger.warning("没有获取到任何数据")
+
+
+def scrape_ted_api(max_pages=5, use_cache=True, *, rate_limit=None, parquet_dir=None, incremental=False,
+                   sqlite_path=None, skip_unchanged=False, pagination=PAGINATION_MODE, profile=OUTPUT_PROFILE):
+    """主爬取函数：运行整个流水线，与原接口相同返回全部记录的 DataFrame（没有数据时为空表）
+
+    第三个参数原来是页面间延迟（秒），现在是每秒请求数，因此 use_cache 之后的参数
+    只能按关键字传入，旧的按位置调用会直接报错而不是被悄悄当作请求速率。
+    全部行都会留在内存中；只需要写出输出和统计摘要时用 run_scraper。
+    """
+    columns = LOT_SCHEMA.select(profile)
+    rows = list(iter_tenders(max_pages, use_cache, rate_limit=rate_limit, parquet_dir=parquet_dir,
+                             incremental=incremental, sqlite_path=sqlite_path, skip_unchanged=skip_unchanged,
+                             pagination=pagination, profile=profile))
+    table = pd.DataFrame([[row.get(col) for col in columns] for row in rows], columns=columns)
+    return ted_table.categorize(table, LOT_SCHEMA.categorical)
+
+
+def run_scraper(max_pages=5, use_cache=True, *, rate_limit=None, parquet_dir=None, incremental=False,
+                sqlite_path=None, skip_unchanged=False, pagination=PAGINATION_MODE, profile=OUTPUT_PROFILE):
+    """运行整个流水线，边写出边统计（行不在内存中收集），返回结果摘要"""
+    summary = {'rows': 0, 'notices': 0, 'notices_with_lots': 0, 'awarded_lots': 0}
+    last_notice = None
+    notice_has_lots = False
+    # 同一公告的标段行是连续产出的，按公告编号的变化计数，不需要保存已见过的编号
+    for row in iter_tenders(max_pages, use_cache, rate_limit=rate_limit, parquet_dir=parquet_dir,
+                            incremental=incremental, sqlite_path=sqlite_path, skip_unchanged=skip_unchanged,
+                            pagination=pagination, profile=profile):
+        summary['rows'] += 1
+        if row.get('notice_id') != last_notice or summary['rows'] == 1:
+            last_notice = row.get('notice_id')
+            summary['notices'] += 1
+            notice_has_lots = False
+        if row.get('lot_id') and not notice_has_lots:
+            summary['notices_with_lots'] += 1
+            notice_has_lots = True
+        if row.get('winner_status') == 'Awarded':
+            summary['awarded_lots'] += 1
+    return summary
+
+
+def reprocess_cache(profile=OUTPUT_PROFILE, batch_size=REPROCESS_BATCH, verify=False):
+    """不请求API，用批量提取把缓存归档中的全部公告重新展开成标段行，写入 REPROCESS_FILE
+
+    verify=True 时每批同时逐条提取并比较结果（用于确认两条路径一致）。
+    """
+    columns = LOT_SCHEMA.select(profile)
+    notices = search_cache.iter_notices(create_payload(columns=columns))
+    total = 0
+    header = True
+    while True:
+        batch = list(itertools.islice(notices, batch_size))
+        if not batch:
+            break
+        if verify:
+            check_page_table(batch, columns)
+        table = process_page_table(batch, columns)
+        table.to_csv(REPROCESS_FILE, mode='w' if header else 'a', header=header, index=False, encoding='utf-8-sig')
+        header = False
+        total += len(table)
+    logger.info(f"从缓存重新提取了 {total} 条记录，保存到 {REPROCESS_FILE}")
+    return total
 
 
 if __name__ == "__main__":
     # 配置参数
     MAX_PAGES = 10  # 爬取页数
     USE_CACHE = False  # 首次运行禁用缓存
-    DELAY = 1.5  # 页面间延迟（秒）
+    RATE_LIMIT = 5  # 初始每秒请求数（随服务器响应自适应调整）
+    WRITE_PARQUET = False  # 同时输出按发布日期分区的Parquet（需要安装pyarrow）
+    INCREMENTAL = False  # 增量模式：只抓取上次运行之后发布的公告
+    WRITE_SQLITE = True  # 同时upsert到SQLite库
+    SKIP_UNCHANGED = False  # 跳过版本和内容都未变化的公告（只输出新增和变更）
+    REPROCESS = False  # 不请求API，从缓存归档批量重新提取
+    VERIFY_BATCH = False  # 重新提取时检查批量提取与逐条提取是否一致
 
     logger.info("=" * 50)
     logger.info("TED招标数据爬取程序启动")
@@ -379,17 +560,24 @@ if __name__ == "__main__":
     logger.info("=" * 50)
 
     start_time = time.time()
-    result_df = scrape_ted_api(MAX_PAGES, USE_CACHE, DELAY)
-    end_time = time.time()
-
-    logger.info(f"总执行时间: {end_time - start_time:.2f} 秒")
-
-    # 打印结果摘要
-    if result_df is not None and not result_df.empty:
-        logger.info("\n数据摘要:")
-        logger.info(f"总记录数: {len(result_df)}")
-        logger.info(f"公告数量: {result_df['notice_id'].nunique()}")
-        logger.info(f"包含标段的公告: {result_df[result_df['lot_id'] != '']['notice_id'].nunique()}")
-        logger.info(f"中标标段: {result_df[result_df['winner_status'] == 'Awarded'].shape[0]}")
+    if REPROCESS:
+        reprocess_cache(OUTPUT_PROFILE, verify=VERIFY_BATCH)
+        logger.info(f"总执行时间: {time.time() - start_time:.2f} 秒")
     else:
-        logger.warning("没有获取到数据")
+        summary = run_scraper(MAX_PAGES, USE_CACHE, rate_limit=RATE_LIMIT,
+                              parquet_dir=PARQUET_DIR if WRITE_PARQUET else None, incremental=INCREMENTAL,
+                              sqlite_path=SQLITE_FILE if WRITE_SQLITE else None,
+                              skip_unchanged=SKIP_UNCHANGED, profile=OUTPUT_PROFILE)
+        end_time = time.time()
+
+        logger.info(f"总执行时间: {end_time - start_time:.2f} 秒")
+
+        # 打印结果摘要
+        if summary['rows']:
+            logger.info("\n数据摘要:")
+            logger.info(f"总记录数: {summary['rows']}")
+            logger.info(f"公告数量: {summary['notices']}")
+            logger.info(f"包含标段的公告: {summary['notices_with_lots']}")
+            logger.info(f"中标标段: {summary['awarded_lots']}")
+        else:
+            logger.warning("没有获取到数据")
@@ -0,0 +1,366 @@
+import os  # 用于文件和目录操作
+import time  # 用于时间控制
+import json  # 用于处理JSON数据
+import gzip  # 用于压缩存储
+import zlib  # 用于压缩归档记录
+import mmap  # 用于内存映射索引和数据文件
+import struct  # 用于定长索引记录
+import hashlib  # 用于生成缓存键
+import tempfile  # 用于原子写入
+import threading  # 用于线程同步
+import logging  # 用于日志记录
+
+logger = logging.getLogger("TEDScraper")
+
+# 搜索页缓存默认配置
+SEARCH_CACHE_TTL = 6 * 3600  # 每个条目的有效期（秒）
+SEARCH_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 缓存目录总大小上限
+
+# 归档索引记录：键(定长UTF-8) + 数据偏移 + 压缩后长度
+INDEX_KEY_SIZE = 32
+INDEX_RECORD = struct.Struct(f'<{INDEX_KEY_SIZE}sQI')
+
+
+def atomic_write(path, data):
+    """先写临时文件再替换，避免中断时留下半个文件"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class DetailCache:
+    """公告详情HTML缓存
+
+    已发布的公告在同一版本内不会变化，因此以 公告编号+版本号 的哈希为键，
+    gzip压缩后存盘；没有版本号的公告不缓存。
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.join(cache_dir, 'detail')
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _path(self, notice_id, version):
+        key = hashlib.sha256(f"{notice_id}|{version}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.html.gz")
+
+    def get(self, notice_id, version):
+        """读取缓存，未命中时返回 None"""
+        if not version:
+            return None
+        path = self._path(notice_id, version)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取公告 {notice_id} 缓存失败: {str(e)}")
+            return None
+
+    def put(self, notice_id, version, html):
+        """压缩并原子写入缓存"""
+        if not version or not html:
+            return
+        try:
+            atomic_write(self._path(notice_id, version), gzip.compress(html.encode('utf-8')))
+        except Exception as e:
+            logger.error(f"保存公告 {notice_id} 缓存失败: {str(e)}")
+
+    def fetch(self, notice_id, version, fetch_func):
+        """优先读缓存，未命中时调用 fetch_func(notice_id) 并写入缓存"""
+        html = self.get(notice_id, version)
+        with self.lock:
+            if html is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if html is not None:
+            return html
+        html = fetch_func(notice_id)
+        self.put(notice_id, version, html)
+        return html
+
+    def log_stats(self):
+        """输出命中统计"""
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        logger.info(f"详情缓存: 命中 {self.hits} 次，未命中 {self.misses} 次，命中率 {rate:.1f}%")
+
+
+def payload_key(payload):
+    """以完整请求体（查询、页码、字段等）的哈希作为缓存键"""
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def fields_key(payload):
+    """请求字段列表的短哈希，不同字段组合的公告记录分开存放"""
+    text = json.dumps(sorted(payload.get('fields', [])), separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:8]
+
+
+class NoticeArchive:
+    """追加写入的公告归档
+
+    数据文件(.dat)依次存放zlib压缩的单条公告JSON；索引文件(.idx)是定长记录
+    (键, 偏移, 长度)，打开时通过内存映射一次性载入，之后按键O(1)定位并从
+    映射的数据文件中直接切片读取。同一键多次写入时以最后一次为准。
+    """
+
+    def __init__(self, directory, name='notices'):
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, f"{name}.dat")
+        self.index_path = os.path.join(directory, f"{name}.idx")
+        self.index = {}
+        self.lock = threading.Lock()
+        self._data_map = None
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) == 0:
+            return
+        with open(self.index_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                usable = len(m) - len(m) % INDEX_RECORD.size  # 忽略中断写入留下的不完整记录
+                view = memoryview(m)[:usable]
+                for key, offset, length in INDEX_RECORD.iter_unpack(view):
+                    self.index[key.rstrip(b'\0').decode('utf-8')] = (offset, length)
+                view.release()
+
+    def _read(self, offset, length):
+        if self._data_map is None or offset + length > len(self._data_map):
+            # 数据文件追加后重新映射
+            self._close_map()
+            with open(self.data_path, 'rb') as f:
+                self._data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data_map[offset:offset + length]
+
+    def _close_map(self):
+        if self._data_map is not None:
+            self._data_map.close()
+            self._data_map = None
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def size(self):
+        """数据文件和索引文件的总字节数"""
+        return sum(os.path.getsize(p) for p in (self.data_path, self.index_path) if os.path.exists(p))
+
+    def record_length(self, key):
+        entry = self.index.get(key)
+        return entry[1] if entry else 0
+
+    def put(self, key, record):
+        """压缩并追加一条记录"""
+        key_bytes = key.encode('utf-8')
+        if len(key_bytes) > INDEX_KEY_SIZE:
+            raise ValueError(f"归档键过长: {key}")
+        blob = zlib.compress(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        with self.lock:
+            with open(self.data_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(blob)
+            with open(self.index_path, 'ab') as f:
+                f.write(INDEX_RECORD.pack(key_bytes, offset, len(blob)))
+            self.index[key] = (offset, len(blob))
+
+    def get(self, key):
+        """按键读取一条记录，不存在时返回 None"""
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            blob = self._read(*entry)
+        return json.loads(zlib.decompress(blob))
+
+    def items(self, suffix=None):
+        """按写入顺序遍历 (键, 记录)；指定 suffix 时只取键以 |suffix 结尾的记录"""
+        with self.lock:
+            entries = sorted(self.index.items(), key=lambda item: item[1][0])
+        for key, entry in entries:
+            if suffix is not None and not key.endswith(f"|{suffix}"):
+                continue
+            with self.lock:
+                blob = self._read(*entry)
+            yield key, json.loads(zlib.decompress(blob))
+
+    def compact(self, keep_keys):
+        """只保留 keep_keys 中的记录，重写数据和索引文件"""
+        with self.lock:
+            keep = [key for key in keep_keys if key in self.index]
+            data_tmp = self.data_path + '.tmp'
+            index_tmp = self.index_path + '.tmp'
+            new_index = {}
+            with open(data_tmp, 'wb') as data_f, open(index_tmp, 'wb') as index_f:
+                offset = 0
+                for key in keep:
+                    blob = self._read(*self.index[key])
+                    data_f.write(blob)
+                    index_f.write(INDEX_RECORD.pack(key.encode('utf-8'), offset, len(blob)))
+                    new_index[key] = (offset, len(blob))
+                    offset += len(blob)
+            self._close_map()
+            os.replace(data_tmp, self.data_path)
+            os.replace(index_tmp, self.index_path)
+            self.index = new_index
+
+    def close(self):
+        with self.lock:
+            self._close_map()
+
+
+class SearchCache:
+    """搜索结果页缓存
+
+    键为完整请求体的哈希，不同查询、字段或页码不会互相覆盖；
+    条目超过 ttl 秒即视为过期，总大小超过 max_bytes 时按最近访问时间淘汰（LRU）。
+    每页只保存一个压缩的页面清单（总数、分面和公告键列表），公告本身存入
+    NoticeArchive，可以不解析整页而直接按公告编号读取单条公告。
+    """
+
+    def __init__(self, cache_dir, ttl=SEARCH_CACHE_TTL, max_bytes=SEARCH_CACHE_MAX_BYTES):
+        self.cache_dir = os.path.join(cache_dir, 'search')
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.archive = NoticeArchive(self.cache_dir)
+
+    def _path(self, payload):
+        return os.path.join(self.cache_dir, f"{payload_key(payload)}.page")
+
+    def _read_manifest(self, path):
+        with open(path, 'rb') as f:
+            return json.loads(zlib.decompress(f.read()))
+
+    def get(self, payload):
+        """读取未过期的缓存，未命中时返回 None"""
+        path = self._path(payload)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - stat.st_mtime > self.ttl:
+            logger.info(f"缓存已过期: {path}")
+            self._remove(path)
+            return None
+        try:
+            data = self._read_manifest(path)
+            notices = [self.archive.get(key) for key in data.pop('_notice_keys', [])]
+        except Exception as e:
+            logger.error(f"加载缓存失败: {str(e)}")
+            self._remove(path)
+            return None
+        if any(notice is None for notice in notices):
+            # 归档中的记录已被淘汰，视为未命中
+            self._remove(path)
+            return None
+        data['notices'] = notices
+        # 记录访问时间供LRU淘汰使用（保留写入时间用于判断过期）
+        os.utime(path, (now, stat.st_mtime))
+        return data
+
+    def get_notice(self, publication_number, payload):
+        """直接从归档读取单条公告（payload 决定字段组合）"""
+        return self.archive.get(f"{publication_number}|{fields_key(payload)}")
+
+    def iter_notices(self, payload):
+        """遍历归档中与 payload 字段组合相同的全部公告（每个公告编号一条，供整批重新提取）"""
+        for _, notice in self.archive.items(fields_key(payload)):
+            yield notice
+
+    def put(self, payload, data):
+        """写入缓存，超出容量时淘汰最久未访问的条目"""
+        if not data:
+            return
+        for _ in self.put_iter(payload, data.get('notices', []), data):
+            pass
+
+    def put_iter(self, payload, notices, data, key_payload=None):
+        """逐条产出 notices 并写入归档，全部产出后写入页面清单
+
+        notices 可以是流式解码的迭代器；清单取 data 中除 notices 外的字段，
+        在迭代结束后才读取。没有迭代完（或写入失败）的页面不写清单，不会被命中。
+        key_payload 指定清单的缓存键（游标分页用不含一次性令牌的请求体，清单不会被读取命中，
+        但参与LRU淘汰并在压缩归档时保留其中的公告）。
+        """
+        page_key = payload_key(payload)
+        suffix = fields_key(payload)
+        keys = []
+        ok = True
+        for i, notice in enumerate(notices):
+            if ok:
+                number = notice.get('publication-number')
+                key = f"{number}|{suffix}" if number else f"_{page_key[:16]}_{i}"
+                try:
+                    self.archive.put(key, notice)
+                    keys.append(key)
+                except Exception as e:
+                    logger.error(f"缓存保存失败: {str(e)}")
+                    ok = False
+            yield notice
+        if not ok:
+            return
+        try:
+            page = {k: v for k, v in data.items() if k != 'notices'}
+            page['_notice_keys'] = keys
+            blob = zlib.compress(json.dumps(page, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            atomic_write(self._path(key_payload or payload), blob)
+        except Exception as e:
+            logger.error(f"缓存保存失败: {str(e)}")
+            return
+        self._evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        with self.lock:
+            pages = []
+            total = self.archive.size
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and entry.name.endswith('.page'):
+                    stat = entry.stat()
+                    pages.append((stat.st_atime, stat.st_size, entry.path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+
+            # 按最近访问时间淘汰页面，直到实际引用的数据降到容量的80%，再压缩归档
+            refs = {}
+            live = 0
+            for _, size, path in pages:
+                try:
+                    refs[path] = self._read_manifest(path).get('_notice_keys', [])
+                except Exception:
+                    refs[path] = []
+                live += size + sum(self.archive.record_length(key) for key in refs[path])
+            pages.sort()
+            target = self.max_bytes * 0.8
+            for _, size, path in pages:
+                if live <= target:
+                    break
+                self._remove(path)
+                live -= size + sum(self.archive.record_length(key) for key in refs.pop(path))
+                logger.info(f"缓存超出容量，淘汰: {path}")
+            keep = dict.fromkeys(key for keys in refs.values() for key in keys)
+            self.archive.compact(keep)
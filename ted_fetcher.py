@@ -0,0 +1,37 @@
+import time  # 用于时间控制
+import logging  # 用于日志记录
+from concurrent.futures import ThreadPoolExecutor  # 用于并发请求
+
+logger = logging.getLogger("TEDScraper")
+
+# 并发抓取默认配置
+DEFAULT_WORKERS = 8  # 最大并发连接数
+
+
+def fetch_details(notice_ids, fetch_func, max_workers=DEFAULT_WORKERS):
+    """并发获取一组公告的详情
+
+    fetch_func(notice_id) 返回详情内容，失败时返回 None；
+    请求速率由 ted_http 的进程共享限流器控制。
+    结果按 notice_ids 的原始顺序逐个产出 (notice_id, raw)，
+    调用方可以在主线程里继续解析和写入。
+    """
+    notice_ids = list(notice_ids)
+    if not notice_ids:
+        return
+
+    def worker(notice_id):
+        try:
+            return fetch_func(notice_id)
+        except Exception as e:
+            logger.error(f"获取公告 {notice_id} 详情异常: {str(e)}")
+            return None
+
+    start_time = time.time()
+    workers = max(1, min(max_workers, len(notice_ids)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for notice_id, raw in zip(notice_ids, executor.map(worker, notice_ids)):
+            yield notice_id, raw
+
+    elapsed = time.time() - start_time
+    logger.info(f"并发获取 {len(notice_ids)} 个公告详情，耗时 {elapsed:.2f} 秒")
@@ -0,0 +1,288 @@
+import time  # 用于基准测试计时
+
+# 字段路径中的“取第一个元素”步骤：列表取 [0]，非列表原样保留
+FIRST = '[0]'
+
+# 多语言文本的取值方式（值为 {语言: 文本或文本列表}）
+TEXT_FIRST_ITEM = 'first_item'  # 第一个非空列表的第一项（不区分语言）
+TEXT_PREFERRED = 'preferred'  # 首选语言的值非空时取它，否则取第一个非空值，都为空时仍取首选语言的值
+TEXT_PRESENT = 'present'  # 有首选语言的键就取它（即使为空），否则取第一个非空值
+
+
+class Field:
+    """声明式字段：从记录出发的取值路径，以及末端多语言文本的取值方式
+
+    路径的每一步可以是键名、备选键名元组（按顺序取第一个存在的键，
+    与 d.get(k1, d.get(k2, default)) 相同）或 FIRST。中间步骤取到空值或
+    非字典时直接返回 default；最后一步的值原样返回（指定 text 时按多语言规则取文本）。
+    键名必须是字符串，default 可以是任意值。
+    """
+
+    def __init__(self, *path, text=None, prefer=None, default=''):
+        self.path = path
+        self.text = text
+        self.prefer = prefer
+        self.default = default
+
+
+class AnyOf:
+    """依次尝试多个字段（Field），返回第一个非空的结果（如中标者名称的多种键名）"""
+
+    def __init__(self, *fields, default=''):
+        self.fields = fields
+        self.default = default
+
+
+def _path_lines(path, ret, default, missing):
+    """路径 -> 取值代码行（结果在 v 中；中间步骤为空时执行 ret(default)，最后一步缺键时取 missing）"""
+    lines = []
+    for i, step in enumerate(path):
+        absent = missing if i == len(path) - 1 else 'None'
+        if i > 0:
+            lines.append(f"if not v: {ret(default)}")
+        if step == FIRST:
+            lines.append("v = v[0] if isinstance(v, list) else v")
+            continue
+        if i > 0:
+            lines.append(f"if not isinstance(v, dict): {ret(default)}")
+        source = 'record' if i == 0 else 'v'
+        if isinstance(step, tuple):
+            *alternatives, final = step
+            expr = f"{source}.get({final!r}, {absent})"
+            for key in reversed(alternatives):
+                expr = f"{source}[{key!r}] if {key!r} in {source} else ({expr})"
+            lines.append(f"v = {expr}")
+        else:
+            lines.append(f"v = {source}.get({step!r}, {absent})")
+    return lines
+
+
+def _text_lines(mode, prefer, default):
+    """多语言取值方式 -> 代码行（v 为非空字典，结果放回 v）"""
+    if mode == TEXT_FIRST_ITEM:
+        return ["for texts in v.values():",
+                "    if texts and len(texts) > 0:",
+                "        v = texts[0]",
+                "        break",
+                "else:",
+                f"    v = {default}"]
+    if mode == TEXT_PREFERRED:
+        return [f"value = v.get({prefer!r}, {default})",
+                "if not value:",
+                "    for text in v.values():",
+                "        if text:",
+                "            value = text",
+                "            break",
+                "v = value"]
+    if mode == TEXT_PRESENT:
+        return [f"if {prefer!r} in v:",
+                f"    v = v[{prefer!r}]",
+                "else:",
+                "    for text in v.values():",
+                "        if text:",
+                "            v = text",
+                "            break",
+                "    else:",
+                f"        v = {default}"]
+    raise ValueError(f"未知的文本取值方式: {mode}")
+
+
+def _field_lines(spec, ret, default):
+    """单个字段 -> 代码行，取到的值通过 ret(表达式) 输出"""
+    if spec.text is None:
+        return _path_lines(spec.path, ret, default, default) + [ret('v')]
+    return (_path_lines(spec.path, ret, default, 'None')
+            + [f"if not v or not isinstance(v, dict): {ret(default)}"]
+            + _text_lines(spec.text, spec.prefer, default)
+            + [ret('v')])
+
+
+def compile_field(spec):
+    """把字段声明编译成取值函数 accessor(record)
+
+    生成一段与手写提取代码等价的平铺代码（没有逐步解释路径的循环），
+    生成的源码保存在 accessor.source 中便于排查。
+    """
+    if isinstance(spec, AnyOf):
+        accessors = [compile_field(field) for field in spec.fields]
+        default = spec.default
+
+        def any_of(record):
+            for accessor in accessors:
+                value = accessor(record)
+                if value:
+                    return value
+            return default
+        any_of.source = '\n'.join(accessor.source for accessor in accessors)
+        return any_of
+
+    body = _field_lines(spec, lambda expr: f"return {expr}", 'default')
+    source = "def accessor(record):\n" + ''.join(f"    {line}\n" for line in body)
+    namespace = {'default': spec.default}
+    exec(source, namespace)
+    accessor = namespace['accessor']
+    accessor.source = source
+    return accessor
+
+
+class FieldSet:
+    """一组字段声明，导入时编译一次
+
+    fields[name] 为单个字段的取值函数（批量提取时按列调用）；
+    extract(record, out) 是把所有字段平铺在一个函数里的整条记录提取函数，
+    没有逐字段的函数调用，用于逐行提取。
+    """
+
+    def __init__(self, specs):
+        self.specs = dict(specs)
+        self.accessors = {name: compile_field(spec) for name, spec in self.specs.items()}
+        self.extract = self._compile_record()
+
+    def _compile_record(self):
+        namespace = {}
+        lines = []
+        for i, (name, spec) in enumerate(self.specs.items()):
+            namespace[f"default_{i}"] = spec.default
+            if isinstance(spec, AnyOf):
+                # 依次计算各备选字段，第一个非空的结果即为该字段的值
+                lines.append("while True:")
+                for j, field in enumerate(spec.fields):
+                    namespace[f"default_{i}_{j}"] = field.default
+                    lines.append("    while True:")
+                    lines += [f"        {line}" for line in
+                              _field_lines(field, lambda expr: f"found = {expr}; break", f"default_{i}_{j}")]
+                    lines.append(f"    if found: out[{name!r}] = found; break")
+                lines.append(f"    out[{name!r}] = default_{i}; break")
+                continue
+            # 每个字段放在只执行一次的循环里，提前返回即 break
+            lines.append("while True:")
+            lines += [f"    {line}" for line in
+                      _field_lines(spec, lambda expr, name=name: f"out[{name!r}] = {expr}; break", f"default_{i}")]
+        source = ("def extract(record, out=None):\n    if out is None:\n        out = {}\n"
+                  + ''.join(f"    {line}\n" for line in lines) + "    return out\n")
+        exec(source, namespace)
+        extract = namespace['extract']
+        extract.source = source
+        return extract
+
+    def __getitem__(self, name):
+        return self.accessors[name]
+
+    def items(self):
+        return self.accessors.items()
+
+
+def compile_fields(specs):
+    """{列名: 字段声明} -> FieldSet（在导入时编译一次）"""
+    return FieldSet(specs)
+
+
+def benchmark(accessors, reference, records, repeat=5):
+    """比较编译的 FieldSet 与手写提取函数：reference(record) 返回同样列名的字典
+
+    返回 (手写耗时, 编译耗时, 不一致的列名列表)，耗时为 repeat 次中最快的一次（秒）。
+    """
+    records = list(records)
+    mismatched = []
+    for record in records:
+        expected = reference(record)
+        extracted = accessors.extract(record)
+        for name, accessor in accessors.items():
+            if name not in mismatched and (accessor(record) != expected.get(name, '')
+                                           or extracted[name] != expected.get(name, '')):
+                mismatched.append(name)
+
+    def best(func):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for record in records:
+                func(record)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    return best(reference), best(accessors.extract), mismatched
+
+
+if __name__ == "__main__":
+    # 基准测试：编译的取值函数 vs 原来手写的多语言提取循环（随机生成的公告结构）
+    import random
+
+    random.seed(0)
+    names = [{}, {'deu': [], 'eng': ['Name']}, {'fra': ['Nom']}, {'eng': []}]
+    titles = [{}, {'eng': 'Title'}, {'eng': '', 'deu': 'Titel'}, {'eng': '', 'fra': ''}]
+    links = [{}, {'html': {'ENG': 'https://ted/en'}}, {'html': {'DEU': '', 'FRA': 'https://ted/fr'}}]
+    winners = [[], [{'officialName': {'eng': ['W']}}], [{'official-name': {}, 'name': {'fra': ['N']}}], [{'legalName': {'deu': ['']}}]]
+    records = [{
+        'buyer-name': random.choice(names),
+        'notice-title': random.choice(titles),
+        'links': random.choice(links),
+        'purpose': random.choice([[], [{'cpv': [{'code': '45000000'}]}], {'cpv': {'code': '44000000'}}]),
+        'estimatedDuration' if random.random() < 0.5 else 'estimated-duration':
+            random.choice([[], [{'duration': 12}], {'duration': 6}]),
+        'winner': random.choice(winners),
+    } for _ in range(50000)]
+
+    specs = {
+        'buyer_name': Field('buyer-name', text=TEXT_FIRST_ITEM),
+        'title': Field('notice-title', text=TEXT_PREFERRED, prefer='eng'),
+        'link': Field('links', 'html', text=TEXT_PRESENT, prefer='ENG'),
+        'purpose_cpv': Field('purpose', FIRST, 'cpv', FIRST, 'code'),
+        'estimated_duration': Field(('estimatedDuration', 'estimated-duration'), FIRST, 'duration'),
+        'winner_name': AnyOf(*[Field('winner', FIRST, key, text=TEXT_FIRST_ITEM)
+                               for key in ('officialName', 'official-name', 'name', 'legalName')]),
+    }
+
+    def hand_written(record):
+        """原来 13.py 中逐字段手写的提取代码"""
+        info = {'buyer_name': '', 'title': '', 'link': '', 'purpose_cpv': '', 'estimated_duration': '',
+                'winner_name': ''}
+        buyer_name = record.get('buyer-name', {})
+        if buyer_name:
+            for names in buyer_name.values():
+                if names and len(names) > 0:
+                    info['buyer_name'] = names[0]
+                    break
+        notice_title = record.get('notice-title', {})
+        info['title'] = notice_title.get('eng', '')
+        if not info['title']:
+            for lang in notice_title:
+                if notice_title[lang]:
+                    info['title'] = notice_title[lang]
+                    break
+        html_links = record.get('links', {}).get('html', {})
+        if html_links and 'ENG' in html_links:
+            info['link'] = html_links['ENG']
+        elif html_links:
+            for lang in html_links:
+                if html_links[lang]:
+                    info['link'] = html_links[lang]
+                    break
+        purpose = record.get('purpose', [])
+        if purpose:
+            first_purpose = purpose[0] if isinstance(purpose, list) else purpose
+            cpv_list = first_purpose.get('cpv', [])
+            if cpv_list:
+                first_cpv = cpv_list[0] if isinstance(cpv_list, list) else cpv_list
+                info['purpose_cpv'] = first_cpv.get('code', '')
+        duration = record.get('estimatedDuration', record.get('estimated-duration', []))
+        if duration:
+            duration_data = duration[0] if isinstance(duration, list) else duration
+            info['estimated_duration'] = duration_data.get('duration', '')
+        winner = record.get('winner', [])
+        if winner:
+            first_winner = winner[0] if isinstance(winner, list) else winner
+            for field in ['officialName', 'official-name', 'name', 'legalName']:
+                name_data = first_winner.get(field, {})
+                if name_data:
+                    for lang, names in name_data.items():
+                        if names and len(names) > 0:
+                            info['winner_name'] = names[0]
+                            break
+                    if info['winner_name']:
+                        break
+        return info
+
+    hand_time, compiled_time, mismatched = benchmark(compile_fields(specs), hand_written, records)
+    print(f"{len(records)} 条记录: 手写 {hand_time:.3f} 秒，编译 {compiled_time:.3f} 秒")
+    print(f"不一致的字段: {', '.join(mismatched)}" if mismatched else "结果一致")
@@ -0,0 +1,182 @@
+import time  # 用于时间控制
+import random  # 用于退避抖动
+import threading  # 用于线程同步
+import logging  # 用于日志记录
+from email.utils import parsedate_to_datetime  # 用于解析HTTP日期格式的Retry-After
+import requests  # 用于发送HTTP请求
+from requests.adapters import HTTPAdapter  # 用于配置连接池
+
+logger = logging.getLogger("TEDScraper")
+
+# 连接池与超时配置
+POOL_SIZE = 16  # 每个主机保持的长连接数（应不小于并发线程数）
+DEFAULT_TIMEOUT = (10, 30)  # (连接超时, 读取超时) 秒
+
+# brotli解码需要额外的包，未安装时只声明gzip/deflate
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+# 速率限制默认配置（整个进程共享）
+DEFAULT_RATE = 5.0  # 初始每秒请求数
+DEFAULT_BURST = 5  # 令牌桶容量（允许的突发请求数）
+MIN_RATE = 0.2  # 被限流时最低降到的速率
+MAX_RATE = 20.0  # 服务器健康时最高恢复到的速率
+RATE_INCREASE = 0.1  # 每次成功请求后速率的增量
+
+# 重试与退避配置
+RETRY_STATUSES = (429, 503)  # 需要退避重试的状态码
+MAX_RETRIES = 5  # 单个请求最多重试次数
+BACKOFF_BASE = 1.0  # 指数退避基数（秒）
+BACKOFF_MAX = 60.0  # 单次退避上限（秒）
+
+
+class AdaptiveRateLimiter:
+    """令牌桶限流器，根据服务器响应自适应调整速率"""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, min_rate=MIN_RATE, max_rate=MAX_RATE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.pause_until = 0.0  # 收到Retry-After后全局暂停到的时间点
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """阻塞直到取得一个令牌"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.pause_until:
+                    wait = self.pause_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        """请求成功：缓慢提升速率（加性增）"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+    def on_throttle(self, delay=None):
+        """被限流：速率减半（乘性减），并按需全局暂停"""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if delay:
+                self.pause_until = max(self.pause_until, time.monotonic() + delay)
+        logger.warning(f"请求被限流，速率降至 {self.rate:.2f} 次/秒")
+
+
+# 进程级共享限流器，搜索和详情请求都经过它
+_limiter = AdaptiveRateLimiter()
+
+
+def get_rate_limiter():
+    """获取进程共享的限流器"""
+    return _limiter
+
+
+def configure_rate_limit(rate=DEFAULT_RATE, burst=DEFAULT_BURST, min_rate=MIN_RATE, max_rate=MAX_RATE):
+    """重新配置进程共享的限流器"""
+    global _limiter
+    _limiter = AdaptiveRateLimiter(rate, burst, min_rate, max_rate)
+    return _limiter
+
+
+def create_session(headers=None, pool_size=POOL_SIZE):
+    """创建带连接池、长连接和压缩传输的会话"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'Accept-Encoding': ACCEPT_ENCODING,
+        'Connection': 'keep-alive'
+    })
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+# 进程级共享会话，所有TED请求复用同一个连接池
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """获取进程共享的会话（首次调用时创建）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def parse_retry_after(value):
+    """解析Retry-After头，返回等待秒数"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def backoff_delay(attempt):
+    """指数退避加随机抖动"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def request(method, url, session=None, max_retries=MAX_RETRIES, **kwargs):
+    """经过共享限流器发送请求，遇到429/503或连接错误时退避重试
+
+    未指定session时使用进程共享会话，未指定timeout时使用DEFAULT_TIMEOUT。
+    返回最后一次的响应；重试用尽仍连接失败时抛出异常。
+    """
+    client = session or get_session()
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    for attempt in range(max_retries + 1):
+        _limiter.acquire()
+        try:
+            response = client.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            if attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"请求 {url} 异常: {str(e)}，{delay:.1f} 秒后重试")
+            time.sleep(delay)
+            continue
+
+        if response.status_code not in RETRY_STATUSES:
+            _limiter.on_success()
+            return response
+
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        _limiter.on_throttle(retry_after)
+        if attempt >= max_retries:
+            return response
+        response.close()  # 流式请求时归还连接
+        delay = retry_after if retry_after is not None else backoff_delay(attempt)
+        logger.warning(f"请求 {url} 返回 {response.status_code}，{delay:.1f} 秒后重试 "
+                       f"({attempt + 1}/{max_retries})")
+        time.sleep(delay)
+    return response
@@ -0,0 +1,102 @@
+import os  # 用于获取CPU核数
+import logging  # 用于日志记录
+from collections import deque  # 用于有界的在途任务队列
+from lxml import etree  # 用于HTML/XML解析
+
+logger = logging.getLogger("TEDScraper")
+
+
+def build_label_index(tree, labels):
+    """单次遍历HTML树，建立 字段名 -> 所在div 的索引
+
+    等价于对每个字段执行 //*[text() = '字段名']/ancestor::div[1]，
+    取文档顺序中第一个匹配；所有字段都找到后提前结束遍历。
+    """
+    wanted = set(labels)
+    index = {}
+    for el in tree.iter():
+        if not isinstance(el.tag, str):  # 跳过注释和处理指令
+            continue
+        # 元素的直接文本节点：自身text和各子元素的tail
+        texts = [el.text] + [child.tail for child in el]
+        for text in texts:
+            if text in wanted and text not in index:
+                div = next(el.iterancestors('div'), None)
+                if div is not None:
+                    index[text] = div
+        if len(index) == len(wanted):
+            break
+    return index
+
+
+def resolve_label_value(div):
+    """从字段所在div中取值（格式：字段名: 值），值为空时查找相邻div"""
+    text = ''.join(div.itertext())
+    parts = text.split(': ', 2)
+    name = parts[0].strip()
+    value = parts[1].strip().replace('\xa0', ' ').replace('\\n', '') if len(parts) > 1 else ''
+    if name and not value:
+        sibling = div.getnext()
+        while sibling is not None and sibling.tag != 'div':
+            sibling = sibling.getnext()
+        if sibling is not None:
+            span = sibling.find('span')
+            if span is not None and span.text:
+                value = span.text
+    return value
+
+
+def extract_labels(data, labels):
+    """解析公告HTML，一次遍历提取所有字段，未找到的字段留空"""
+    tree = etree.HTML(data) if isinstance(data, (str, bytes)) else data
+    if tree is None:
+        return {label: '' for label in labels}
+    index = build_label_index(tree, labels)
+    return {label: resolve_label_value(index[label]) if label in index else '' for label in labels}
+
+
+def _parse_safely(parse_func, raw, notice_id):
+    if not raw:
+        return None
+    try:
+        return parse_func(raw, notice_id)
+    except Exception as e:
+        logger.error(f"解析公告 {notice_id} 失败: {str(e)}")
+        return None
+
+
+def _collect(notice_id, future):
+    if future is None:
+        return notice_id, None
+    try:
+        return notice_id, future.result()
+    except Exception as e:
+        logger.error(f"解析公告 {notice_id} 失败: {str(e)}")
+        return notice_id, None
+
+
+def parse_pipeline(items, parse_func, executor=None, max_pending=None):
+    """把已获取的公告HTML交给进程池解析，按原顺序流式产出结果
+
+    items 产出 (notice_id, raw)，parse_func(raw, notice_id) 必须是模块级函数。
+    同时在途的解析任务不超过 max_pending 个，队列满时先等待最早的结果，
+    由此对上游抓取形成背压，内存占用保持有界。
+    未提供 executor 时在当前线程内顺序解析。产出 (notice_id, result)，
+    获取失败或解析出错时 result 为 None。
+    """
+    if executor is None:
+        for notice_id, raw in items:
+            yield notice_id, _parse_safely(parse_func, raw, notice_id)
+        return
+
+    if max_pending is None:
+        max_pending = 2 * (os.cpu_count() or 1)
+
+    pending = deque()
+    for notice_id, raw in items:
+        future = executor.submit(parse_func, raw, notice_id) if raw else None
+        pending.append((notice_id, future))
+        while len(pending) >= max_pending:
+            yield _collect(*pending.popleft())
+    while pending:
+        yield _collect(*pending.popleft())
@@ -0,0 +1,227 @@
+import re  # 用于识别日期格式
+import sys  # 用于字符串驻留
+from collections.abc import Mapping
+
+
+class OutputSchema:
+    """声明式输出schema：每个输出列及其依赖的搜索API字段
+
+    create_payload 请求的 fields 由所选的列推导（只请求输出需要的字段），
+    提取函数按所选的列决定是否展开批次、输出哪些列。
+    profiles 为常用的列组合，select 时可以传组合名或列名列表。
+    categorical 为取值重复度高的列（国家、类型、币种、采购方等）：提取时驻留字符串，
+    表和Parquet中按分类/字典编码存储。
+    """
+
+    def __init__(self, columns, required_fields=('publication-number',), profiles=None, categorical=()):
+        self.columns = {name: tuple(fields) for name, fields in columns}
+        self.required_fields = tuple(required_fields)
+        self.categorical = tuple(name for name in self.columns if name in categorical)
+        self.profiles = {'full': list(self.columns)}
+        self.profiles.update(profiles or {})
+        self._layouts = {}
+        for profile in self.profiles.values():
+            self.select(profile)
+
+    @property
+    def names(self):
+        return list(self.columns)
+
+    def select(self, profile=None):
+        """返回要输出的列名（保持schema中的顺序）"""
+        if profile is None:
+            return self.names
+        if isinstance(profile, str):
+            if profile not in self.profiles:
+                raise ValueError(f"未知的输出组合: {profile}")
+            profile = self.profiles[profile]
+        unknown = [name for name in profile if name not in self.columns]
+        if unknown:
+            raise ValueError(f"schema中没有这些列: {', '.join(unknown)}")
+        return [name for name in self.columns if name in profile]
+
+    def fields(self, columns=None):
+        """所选列需要请求的API字段（去重、保持顺序）"""
+        fields = list(self.required_fields)
+        for name in self.select(columns):
+            for field in self.columns[name]:
+                if field not in fields:
+                    fields.append(field)
+        return fields
+
+    def needs(self, field, columns=None):
+        """所选列是否依赖某个API字段"""
+        return field in self.fields(columns)
+
+    def layout(self, columns=None, lot_field='lots'):
+        """所选列的行布局：依赖 lot_field 的列为批次级，其余为公告级（同一组列复用同一个布局）"""
+        key = (columns if columns is None or isinstance(columns, str) else tuple(columns), lot_field)
+        if key not in self._layouts:
+            columns = self.select(columns)
+            self._layouts[key] = RowLayout([name for name in columns if lot_field not in self.columns[name]],
+                                           [name for name in columns if lot_field in self.columns[name]],
+                                           self.categorical)
+        return self._layouts[key]
+
+
+class RowLayout:
+    """定长的批次行布局
+
+    公告级的列在同一公告的所有批次行之间共享一个元组，批次级的列每行一个元组，
+    行对象本身只有三个槽位，不再为每个批次复制一个约30个键的字典。
+    interned 中的列在构造行时驻留字符串（sys.intern），同一取值在所有行中只存一份。
+    """
+
+    def __init__(self, common_columns, lot_columns, interned=()):
+        self.common_columns = tuple(common_columns)
+        self.lot_columns = tuple(lot_columns)
+        self.common_interned = [i for i, name in enumerate(self.common_columns) if name in interned]
+        self.lot_interned = [i for i, name in enumerate(self.lot_columns) if name in interned]
+        self.columns = self.common_columns + self.lot_columns
+        self.positions = {name: (0, i) for i, name in enumerate(self.common_columns)}
+        self.positions.update({name: (1, i) for i, name in enumerate(self.lot_columns)})
+
+    def common(self, values):
+        """公告级的值元组（缺失的列为空字符串）"""
+        return intern_values([values.get(name, '') for name in self.common_columns], self.common_interned)
+
+    def row(self, common, values):
+        """用共享的公告级元组和一个批次的值字典构造一行"""
+        return LotRow(self, common,
+                      intern_values([values.get(name, '') for name in self.lot_columns], self.lot_interned))
+
+
+def intern_values(values, positions):
+    """驻留列表中指定位置的字符串，返回元组"""
+    for i in positions:
+        value = values[i]
+        if type(value) is str:
+            values[i] = sys.intern(value)
+    return tuple(values)
+
+
+class LotRow(Mapping):
+    """只读的批次行，按列名取值的用法与字典相同（sink 和 DataFrame 都可以直接使用）"""
+
+    __slots__ = ('layout', 'common', 'lot')
+
+    def __init__(self, layout, common, lot):
+        self.layout = layout
+        self.common = common
+        self.lot = lot
+
+    def __getitem__(self, name):
+        part, i = self.layout.positions[name]
+        return self.lot[i] if part else self.common[i]
+
+    def get(self, name, default=None):
+        position = self.layout.positions.get(name)
+        if position is None:
+            return default
+        return self.lot[position[1]] if position[0] else self.common[position[1]]
+
+    def __iter__(self):
+        return iter(self.layout.columns)
+
+    def __len__(self):
+        return len(self.layout.columns)
+
+    def __contains__(self, name):
+        return name in self.layout.positions
+
+    def __repr__(self):
+        return f"LotRow({dict(self)})"
+
+
+def lot_key(lot_id, position):
+    """批次标识；为空时按批次在公告中的位置编号（#1、#2…），保证 (公告编号, 批次标识) 唯一"""
+    return lot_id if lot_id else f"#{position + 1}"
+
+
+# 搜索API的国家代码（ISO 3166-1 alpha-3）-> 详情页显示的国家名称
+COUNTRY_NAMES = {
+    'AUT': 'Austria', 'BEL': 'Belgium', 'BGR': 'Bulgaria', 'HRV': 'Croatia', 'CYP': 'Cyprus',
+    'CZE': 'Czechia', 'DNK': 'Denmark', 'EST': 'Estonia', 'FIN': 'Finland', 'FRA': 'France',
+    'DEU': 'Germany', 'GRC': 'Greece', 'HUN': 'Hungary', 'IRL': 'Ireland', 'ITA': 'Italy',
+    'LVA': 'Latvia', 'LTU': 'Lithuania', 'LUX': 'Luxembourg', 'MLT': 'Malta', 'NLD': 'Netherlands',
+    'POL': 'Poland', 'PRT': 'Portugal', 'ROU': 'Romania', 'SVK': 'Slovakia', 'SVN': 'Slovenia',
+    'ESP': 'Spain', 'SWE': 'Sweden', 'ISL': 'Iceland', 'LIE': 'Liechtenstein', 'NOR': 'Norway',
+    'CHE': 'Switzerland', 'GBR': 'United Kingdom', 'ALB': 'Albania', 'BIH': 'Bosnia and Herzegovina',
+    'MNE': 'Montenegro', 'MKD': 'North Macedonia', 'SRB': 'Serbia', 'MDA': 'Moldova',
+    'UKR': 'Ukraine', 'GEO': 'Georgia', 'TUR': 'Türkiye',
+}
+
+
+def country_name(code):
+    """国家代码转换为详情页的国家名称，未知代码返回空字符串（该字段视为取不到）"""
+    return COUNTRY_NAMES.get(code.upper(), '')
+
+
+def html_date(value):
+    """搜索API的日期（2024-05-01+02:00）转换为详情页的格式（01/05/2024），无法识别时返回空字符串"""
+    match = re.match(r'(\d{4})-(\d{2})-(\d{2})', value)
+    return f"{match.group(3)}/{match.group(2)}/{match.group(1)}" if match else ''
+
+
+# 20.py / 21.py 详情页字段标签 -> (搜索API字段, 取值的键, 转换为详情页格式的函数)，用于只靠搜索结果填充这些列
+LABEL_SEARCH_FIELDS = {
+    'Official name': ('buyer-name', None, None),
+    'Legal type of the buyer': ('buyer-legal-type', 'label', None),
+    'Country': ('buyer-country', 'label', country_name),
+    'Estimated value excluding VAT': ('estimated-value', 'amount', None),
+    'Main classification': ('cpv', 'code', None),
+    'Publication date': ('publication-date', None, html_date),
+}
+
+
+def first_value(value, key=None):
+    """搜索字段的第一个非空值：列表取第一个非空元素，字典按 key 取，多语言字典优先取英文"""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        for item in value:
+            found = first_value(item, key)
+            if found:
+                return found
+        return ''
+    if isinstance(value, dict):
+        if key is not None:
+            return first_value(value.get(key))
+        for lang in ('eng', 'ENG'):
+            found = first_value(value.get(lang))
+            if found:
+                return found
+        for item in value.values():
+            found = first_value(item)
+            if found:
+                return found
+        return ''
+    return str(value)
+
+
+def label_search_fields(labels):
+    """这些详情页字段可以从哪些搜索API字段取得"""
+    fields = []
+    for label in labels:
+        if label in LABEL_SEARCH_FIELDS and LABEL_SEARCH_FIELDS[label][0] not in fields:
+            fields.append(LABEL_SEARCH_FIELDS[label][0])
+    return fields
+
+
+def labels_without_search(labels):
+    """搜索API取不到的详情页字段（混合模式下由搜索结果填充的行中这些列为空）"""
+    return [label for label in labels if label not in LABEL_SEARCH_FIELDS]
+
+
+def labels_from_search(notice, labels):
+    """用搜索结果中的公告填充详情页字段（国家、日期转换为详情页的格式），取不到值的字段不出现在结果中"""
+    values = {}
+    for label in labels:
+        if label in LABEL_SEARCH_FIELDS:
+            field, key, convert = LABEL_SEARCH_FIELDS[label]
+            value = first_value(notice.get(field), key)
+            if value and convert:
+                value = convert(value)
+            if value:
+                values[label] = value
+    return values
@@ -0,0 +1,473 @@
+import re  # 用于解析查询语句
+import copy  # 用于复制请求体
+import queue  # 用于在抓取线程和调用方之间传递页面
+import threading  # 用于通知抓取线程停止
+import logging  # 用于日志记录
+from collections import namedtuple  # 用于分片描述
+from concurrent.futures import ThreadPoolExecutor  # 用于并行抓取分片
+import ted_http  # 用于共享会话、限流和退避重试
+from ted_state import publication_sort_key  # 用于比较公告编号
+
+# ijson 是可选依赖，未安装时搜索响应整页解码
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+    ObjectBuilder = None
+
+logger = logging.getLogger("TEDScraper")
+
+API_URL = 'https://tedweb.api.ted.europa.eu/private-search/api/v1/notices/search'
+
+# 分片配置
+SHARD_MAX_NOTICES = 5000  # 每个分片的目标公告数（避开深分页）
+SHARD_WORKERS = 4  # 并行抓取的分片数
+
+# 按公告编号批量查询
+LOOKUP_CHUNK_SIZE = 100  # 每个查询包含的公告编号数（不超过每页条数上限）
+LOOKUP_WORKERS = 4  # 并发查询数
+
+# 分页方式
+PAGINATION_ITERATION = 'ITERATION'  # 服务端游标：每页返回下一页的令牌，成本不随深度增长
+PAGINATION_PAGE_NUMBER = 'PAGE_NUMBER'  # 页码偏移
+PAGINATION_AUTO = 'AUTO'  # 先尝试游标，服务端不支持时退回页码
+
+# 一个分片：子查询、预计公告数、用于日志的说明
+Shard = namedtuple('Shard', ['query', 'count', 'label'])
+
+
+def split_query(query):
+    """把查询拆成 (条件, 排序子句)"""
+    match = re.search(r'\s+SORT\s+BY\s+.*$', query, flags=re.IGNORECASE)
+    if not match:
+        return query.strip(), ''
+    return query[:match.start()].strip(), match.group(0).strip()
+
+
+def build_query(condition, extra, sort_clause=''):
+    """在原查询条件上追加分片条件"""
+    query = f"({condition}) AND ({extra})"
+    return f"{query} {sort_clause}" if sort_clause else query
+
+
+def facet_counts(data, facet):
+    """从搜索响应中取出某个分面的 [(值, 数量)]，兼容列表和字典两种结构"""
+    raw = (data or {}).get('facets', {}).get(facet)
+    if not raw:
+        return []
+    if isinstance(raw, dict):
+        return [(str(k), int(v)) for k, v in raw.items()]
+    counts = []
+    for item in raw:
+        if not isinstance(item, dict):
+            continue
+        value = next((item[k] for k in ('id', 'value', 'key', 'code', 'label') if item.get(k)), None)
+        count = next((item[k] for k in ('count', 'docCount', 'total') if item.get(k) is not None), 0)
+        if value is not None:
+            counts.append((str(value), int(count)))
+    return counts
+
+
+def fetch_facets(payload, facets, session=None, headers=None):
+    """只请求分面统计（每页1条、只要公告编号字段），返回 {分面: [(值, 数量)]} 和总数"""
+    probe = copy.deepcopy(payload)
+    probe.update({'page': 1, 'limit': 1, 'fields': ['publication-number'],
+                  'facets': {facet: [] for facet in facets}})
+    response = ted_http.request('POST', API_URL, session=session, json=probe, headers=headers)
+    response.raise_for_status()
+    data = response.json()
+    return {facet: facet_counts(data, facet) for facet in facets}, data.get('totalNoticeCount', 0)
+
+
+def plan_date_shards(query, counts, max_notices=SHARD_MAX_NOTICES):
+    """按发布日期把公告数连续地装箱成若干日期区间
+
+    相邻分片的区间首尾相接（每个分片到下一个分片的起始日为止），第一个分片没有下界、
+    最后一个没有上界，分面列表被截断或漏掉的日期也一定落在某个分片里。
+    """
+    condition, sort_clause = split_query(query)
+    days = []
+    for value, count in counts:
+        day = re.sub(r'\D', '', value)[:8]
+        if len(day) == 8:
+            days.append((day, count))
+        else:
+            logger.warning(f"无法识别的发布日期分面值 {value!r}（{count} 条），由相邻分片覆盖")
+    days.sort()
+
+    bins = []  # [起始日, 结束日, 公告数]
+    for day, count in days:
+        if bins and bins[-1][2] + count <= max_notices:
+            bins[-1][1] = day
+            bins[-1][2] += count
+        else:
+            bins.append([day, day, count])
+        if count > max_notices:
+            logger.warning(f"{day} 单日公告数 {count} 超过分片上限 {max_notices}")
+    if not bins:
+        return [Shard(query, 0, 'all')]
+
+    shards = []
+    for i, (start, end, total) in enumerate(bins):
+        bounds = []
+        if i > 0:
+            bounds.append(f"publication-date>={start}")
+        if i < len(bins) - 1:
+            bounds.append(f"publication-date<{bins[i + 1][0]}")
+        label = f"{start if i > 0 else '*'}-{end if i < len(bins) - 1 else '*'}"
+        query_i = build_query(condition, ' AND '.join(bounds), sort_clause) if bounds else query
+        shards.append(Shard(query_i, total, label))
+    return shards
+
+
+def plan_value_shards(query, field, counts, max_notices=SHARD_MAX_NOTICES, total=None):
+    """按离散值（如买方国家）把公告数均衡地分配到若干分片（大的先放）
+
+    另加一个兜底分片抓取该字段为空或取值不在分面列表中的公告。
+    """
+    condition, sort_clause = split_query(query)
+    covered = sum(count for _, count in counts)
+    bins = [[] for _ in range(max(1, -(-covered // max_notices)))]
+    sizes = [0] * len(bins)
+    for value, count in sorted(counts, key=lambda vc: -vc[1]):
+        i = sizes.index(min(sizes))
+        bins[i].append(value)
+        sizes[i] += count
+    shards = [Shard(build_query(condition, f"{field} IN ({' '.join(values)})", sort_clause), size, ' '.join(values))
+              for values, size in zip(bins, sizes) if values]
+    values = ' '.join(value for value, _ in counts)
+    rest = max(0, (total or 0) - covered)
+    shards.append(Shard(build_query(condition, f"NOT ({field} IN ({values}))", sort_clause), rest, 'other'))
+    return shards
+
+
+def plan_shards(payload, by='publication-date', max_notices=SHARD_MAX_NOTICES, session=None, headers=None):
+    """先发一次只要分面的请求，再把查询拆成数量已知、大小均衡的子查询
+
+    分片合起来总是覆盖整个查询：日期分片首尾相接且两端不设界，按值分片另有兜底分片，
+    分面统计与总数不一致时记录警告。
+    """
+    facets, total = fetch_facets(payload, [by], session=session, headers=headers)
+    counts = facets[by]
+    if not counts:
+        logger.warning(f"响应中没有 {by} 分面，不分片")
+        return [Shard(payload['query'], total, 'all')]
+    if by == 'publication-date':
+        shards = plan_date_shards(payload['query'], counts, max_notices)
+    else:
+        shards = plan_value_shards(payload['query'], by, counts, max_notices, total)
+    covered = sum(count for _, count in counts)
+    logger.info(f"共 {total} 条公告，按 {by} 拆成 {len(shards)} 个分片")
+    if covered != total:
+        logger.warning(f"{by} 分面统计只覆盖 {covered}/{total} 条公告（分面列表可能被截断或有缺失值），"
+                       f"其余公告由两端不设界的日期分片或兜底分片抓取")
+    return shards
+
+
+class NoticeClaims:
+    """跨分片按公告编号去重
+
+    按多值字段（如买方国家，一个联合采购公告可有多个国家）分片时各分片会重叠，
+    同一公告只由第一个取到它的分片输出。可在多个抓取线程中共用。
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.duplicates = 0
+        self.lock = threading.Lock()
+
+    def claim(self, notice):
+        """公告第一次出现时返回 True；没有公告编号的公告总是返回 True"""
+        number = notice.get('publication-number')
+        if not number:
+            return True
+        with self.lock:
+            if number in self.seen:
+                self.duplicates += 1
+                return False
+            self.seen.add(number)
+            return True
+
+    def release(self, numbers):
+        """归还认领的公告编号（认领它们的页面没有输出时），之后其他分片可以再次认领"""
+        with self.lock:
+            self.seen.difference_update(numbers)
+
+
+def crawl_shards(shards, crawl_func, workers=SHARD_WORKERS):
+    """并行抓取各分片，crawl_func(shard) 逐页产出结果；按到达顺序产出 (shard, 一页结果)
+
+    各分片的页面经有界队列交给调用方，队列满时抓取线程等待，内存中最多保留
+    约 2 × workers 页的结果（不会整片收集）。分片失败时产出 (shard, None)，
+    该分片此前已产出的页面不会撤回。调用方提前停止迭代时各抓取线程随之退出。
+    """
+    results = queue.Queue(maxsize=max(1, workers))
+    finished = object()  # 分片结束的标记
+    stop = threading.Event()
+
+    def put(item):
+        # 调用方已停止时不再等待队列空位
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(shard):
+        try:
+            for page in crawl_func(shard):
+                if not put((shard, page)):
+                    return
+        except Exception as e:
+            logger.error(f"分片 {shard.label} 抓取失败: {str(e)}")
+            put((shard, None))
+        finally:
+            put((shard, finished))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(shards))))
+    try:
+        for shard in shards:
+            executor.submit(run, shard)
+        remaining = len(shards)
+        while remaining:
+            shard, page = results.get()
+            if page is finished:
+                remaining -= 1
+                continue
+            yield shard, page
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def lookup_payload(numbers, fields):
+    """按公告编号列表查询的请求体"""
+    return {
+        "query": f"publication-number IN ({' '.join(numbers)})",
+        "page": 1,
+        "limit": len(numbers),
+        "fields": list(fields),
+        "validation": False,
+        "scope": "ALL",
+        "language": "EN",
+        "onlyLatestVersions": True,
+        "facets": {}
+    }
+
+
+def lookup_notices(numbers, fields, chunk_size=LOOKUP_CHUNK_SIZE, workers=LOOKUP_WORKERS,
+                   session=None, headers=None):
+    """按公告编号批量取回公告，每个查询打包 chunk_size 个编号，多个查询并发发出
+
+    按输入顺序（去重后）产出 (公告编号, 公告)，查不到或查询失败的公告为 None。
+    """
+    numbers = list(dict.fromkeys(n for n in numbers if n))
+    chunks = [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+
+    def fetch_chunk(chunk):
+        try:
+            response = ted_http.request('POST', API_URL, session=session,
+                                        json=lookup_payload(chunk, fields), headers=headers)
+            response.raise_for_status()
+            return {n.get('publication-number'): n for n in response.json().get('notices', [])}
+        except Exception as e:
+            logger.error(f"批量查询 {chunk[0]} 等 {len(chunk)} 个公告失败: {str(e)}")
+            return {}
+
+    found = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as executor:
+        for chunk, notices in zip(chunks, executor.map(fetch_chunk, chunks)):
+            for number in chunk:
+                notice = notices.get(number)
+                found += notice is not None
+                yield number, notice
+    logger.info(f"批量查询: {len(numbers)} 个公告编号，{len(chunks)} 个请求，找到 {found} 个")
+
+
+def pagination_params(mode, page_number, token=None):
+    """按分页方式生成请求体中的分页字段"""
+    if mode == PAGINATION_ITERATION:
+        params = {'paginationMode': PAGINATION_ITERATION}
+        if token:
+            params['iterationNextToken'] = token
+        return params
+    return {'page': page_number}
+
+
+def pagination_mode(mode, use_cache):
+    """实际使用的分页方式：AUTO 且启用缓存时用页码分页
+
+    游标令牌是一次性的，游标分页的页面无法从缓存读取；页码分页的页面按请求体命中缓存。
+    """
+    return PAGINATION_PAGE_NUMBER if use_cache and mode == PAGINATION_AUTO else mode
+
+
+def cache_payload(payload, page_number):
+    """页面清单的缓存键所用的请求体：游标分页去掉一次性令牌、换成页序号，页码分页原样返回"""
+    if 'paginationMode' not in payload:
+        return payload
+    key = {k: v for k, v in payload.items() if k != 'iterationNextToken'}
+    key['page'] = page_number
+    return key
+
+
+def stream_search_response(response):
+    """流式解码搜索响应（请求需带 stream=True）
+
+    返回的 dict 中 notices 是逐条解码的迭代器，总数、游标等顶层字段在迭代过程中
+    填入同一个 dict，迭代结束后才完整；同一时刻只有一条公告在内存中。
+    未安装 ijson 时退回整页解码。
+    """
+    if ijson is None:
+        return response.json()
+    data = {}
+    data['notices'] = _iter_notices(response, data)
+    return data
+
+
+def _iter_notices(response, data):
+    response.raw.decode_content = True  # 由urllib3解压gzip/br
+    builder = None
+    try:
+        for prefix, event, value in ijson.parse(response.raw, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == 'notices.item' and event in ('end_map', 'end_array'):
+                    yield builder.value
+                    builder = None
+            elif prefix == 'notices.item':
+                builder = ObjectBuilder()
+                builder.event(event, value)
+                if event not in ('start_map', 'start_array'):
+                    yield builder.value
+                    builder = None
+            elif prefix and '.' not in prefix and event in ('string', 'number', 'boolean', 'null'):
+                data[prefix] = value
+    finally:
+        response.close()
+
+
+class Paginator:
+    """搜索结果分页
+
+    fetch_page(page_number, params) 用 params 中的分页字段发出请求，失败时返回 None；
+    返回的 notices 可以是流式解码的迭代器（见 stream_search_response）。
+    优先使用游标分页；首页响应里没有 iterationNextToken（或游标请求被拒绝）时退回页码分页。
+    查询按 publication-number 降序时，编号不小于上一页最小编号的公告视为与上一页重叠并丢弃；
+    页码模式下总数在翻页过程中减少时记为可能的缺口（gaps），调用方据此决定是否推进水位线。
+    """
+
+    def __init__(self, fetch_page, mode=PAGINATION_AUTO, descending=True,
+                 number_of=lambda notice: notice.get('publication-number')):
+        self.fetch_page = fetch_page
+        self.mode = mode
+        self.descending = descending
+        self.number_of = number_of
+        self.last_key = None
+        self.last_ids = set()
+        self.total = None
+        self.overlaps = 0
+        self.gaps = 0
+        self.failed = False
+
+    def _fetch(self, page_number, token):
+        if self.mode == PAGINATION_PAGE_NUMBER:
+            return self.fetch_page(page_number, pagination_params(PAGINATION_PAGE_NUMBER, page_number))
+        data = self.fetch_page(page_number, pagination_params(PAGINATION_ITERATION, page_number, token))
+        if data is None and self.mode == PAGINATION_AUTO:
+            self.mode = PAGINATION_PAGE_NUMBER
+            logger.info("游标分页请求失败，退回页码分页")
+            data = self.fetch_page(page_number, pagination_params(PAGINATION_PAGE_NUMBER, page_number))
+        return data
+
+    def _filter(self, notices, stats):
+        """逐条去掉与上一页重叠的公告；流式读取中断时置 failed 并结束本页"""
+        try:
+            for notice in notices:
+                stats['raw'] += 1
+                number = self.number_of(notice)
+                key = publication_sort_key(number)
+                if number in self.last_ids or (self.descending and self.last_key is not None
+                                               and key >= self.last_key):
+                    stats['dropped'] += 1
+                    continue
+                stats['ids'].add(number)
+                if stats['lowest'] is None or key < stats['lowest']:
+                    stats['lowest'] = key
+                yield notice
+        except Exception as e:
+            logger.error(f"读取页面数据中断: {str(e)}")
+            self.failed = True
+            stats['error'] = True
+
+    def _finish_page(self, page_number, data, stats):
+        """整页迭代完后：确定分页方式，记录重叠和总数变化"""
+        if self.mode == PAGINATION_AUTO:
+            if 'iterationNextToken' in data:
+                self.mode = PAGINATION_ITERATION
+                logger.info("使用游标分页")
+            else:
+                self.mode = PAGINATION_PAGE_NUMBER
+                logger.info("服务端不支持游标分页，退回页码分页")
+        if stats['dropped']:
+            self.overlaps += stats['dropped']
+            logger.warning(f"第 {page_number} 页: 去除了 {stats['dropped']} 条与上一页重叠的公告")
+        total = data.get('totalNoticeCount')
+        if self.mode == PAGINATION_PAGE_NUMBER and self.total is not None and total is not None:
+            if total < self.total:
+                self.gaps += self.total - total
+                logger.warning(f"第 {page_number} 页: 总数从 {self.total} 减少到 {total}，可能漏掉了公告")
+            elif total > self.total:
+                logger.info(f"第 {page_number} 页: 总数从 {self.total} 增加到 {total}，重叠的公告将被去除")
+        if total is not None:
+            self.total = total
+        if stats['lowest'] is not None:
+            self.last_key = stats['lowest']
+        self.last_ids = stats['ids']
+
+    def pages(self, max_pages=None, skip=None, stop_on_error=True):
+        """逐页产出 (页码, 数据)，数据中的 notices 是已去重的迭代器，只能迭代一次
+
+        迭代完一页后 failed 为真说明该页读取中断、数据不完整。
+        skip(page_number) 为真的页面不产出；页码模式下这些页面也不请求。
+        stop_on_error=False 时页码模式跳过失败的页面继续翻页（记为缺口）。
+        """
+        token = None
+        page_number = 1
+        while max_pages is None or page_number <= max_pages:
+            if self.mode == PAGINATION_PAGE_NUMBER and skip and skip(page_number):
+                page_number += 1
+                continue
+            data = self._fetch(page_number, token)
+            if not data:
+                self.failed = True
+                if self.mode == PAGINATION_PAGE_NUMBER and not stop_on_error:
+                    self.gaps += 1
+                    page_number += 1
+                    continue
+                return
+            stats = {'raw': 0, 'dropped': 0, 'ids': set(), 'lowest': None, 'error': False}
+            notices = self._filter(data.get('notices', []), stats)
+            data['notices'] = notices
+            if not (skip and skip(page_number)):
+                yield page_number, data
+            # 调用方没有读完时读完本页（总数和游标可能在响应末尾）
+            for _ in notices:
+                pass
+            if stats['error']:
+                if self.mode == PAGINATION_PAGE_NUMBER and not stop_on_error:
+                    self.gaps += 1
+                    page_number += 1
+                    continue
+                return
+            if stats['raw'] == 0:
+                return
+            self._finish_page(page_number, data, stats)
+            if self.mode == PAGINATION_ITERATION:
+                token = data.get('iterationNextToken')
+                if not token:
+                    return
+            page_number += 1
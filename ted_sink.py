@@ -0,0 +1,373 @@
+import os  # 用于文件和目录操作
+import shutil  # 用于清空旧的Parquet分区
+import csv  # 用于CSV文件读写
+import time  # 用于时间控制
+import logging  # 用于日志记录
+import sqlite3  # 用于SQLite存储
+
+# pyarrow 是可选依赖，只有输出Parquet时才需要
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger("TEDScraper")
+
+# 缓冲刷新策略
+FLUSH_ROWS = 200  # 缓冲行数达到该值时写盘
+FLUSH_INTERVAL = 5.0  # 距上次写盘超过该秒数时写盘
+
+# Parquet输出配置
+PARQUET_BATCH_ROWS = 5000  # 每个记录批次的行数
+PARQUET_COMPRESSION = 'zstd'  # 压缩算法
+NUMERIC_COLUMNS = (  # 按数值类型存储的列（13.py 与 newtender.py 的金额字段）
+    'estimated_value', 'winner_value',
+    'total_value', 'lot_value', 'contract_value'
+)
+CATEGORICAL_COLUMNS = (  # 取值重复度高、按字典编码存储的列（13.py 与 newtender.py）
+    'notice_type', 'procedure_type', 'contract_nature', 'buyer_name', 'buyer_legal_type', 'buyer_country',
+    'estimated_currency', 'winner_selection_status', 'winner_currency',
+    'business_opportunity', 'buyer_official_name', 'winner_status'
+)
+PARTITION_SOURCE = 'publication_date'  # 分区依据的列
+PARTITION_COLUMN = 'publication_day'  # 分区目录名（取发布日期的 YYYY-MM-DD 部分）
+
+# SQLite输出配置
+SQLITE_BATCH_ROWS = 1000  # 每个事务写入的行数
+SQLITE_KEY_COLUMNS = ('notice_number', 'lot_identifier')  # 主键
+SQLITE_INDEX_COLUMNS = ('buyer_country', 'main_cpv', 'publication_date')  # 建立索引的列
+
+
+class CsvSink:
+    """追加写入的CSV输出：文件只打开一次，按批次写入，表头只写一次"""
+
+    def __init__(self, filename, fieldnames=None, append=True,
+                 flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL, encoding='utf-8-sig'):
+        self.filename = filename
+        self.fieldnames = list(fieldnames) if fieldnames else None
+        self.append = append
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.encoding = encoding
+        self.buffer = []
+        self.count = 0
+        self.file = None
+        self.writer = None
+        self.last_flush = time.monotonic()
+
+    def _open(self):
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 追加到已有内容的文件时不再写表头
+        has_content = self.append and os.path.exists(self.filename) and os.path.getsize(self.filename) > 0
+        self.file = open(self.filename, 'a' if self.append else 'w', newline='', encoding=self.encoding)
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction='ignore')
+        if not has_content:
+            self.writer.writeheader()
+
+    def write(self, row):
+        """写入一行（先进入缓冲）"""
+        if self.fieldnames is None:
+            self.fieldnames = list(row.keys())
+        self.buffer.append(row)
+        if len(self.buffer) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def write_rows(self, rows):
+        """写入多行"""
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        """把缓冲中的行写到磁盘"""
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        if self.file is None:
+            self._open()
+        self.writer.writerows(self.buffer)
+        self.file.flush()
+        self.count += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        """写出剩余缓冲并关闭文件"""
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            logger.info(f"已保存 {self.count} 条记录到 {self.filename}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def to_number(value):
+    """把金额转成浮点数，空值或无法解析时返回 None"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '').strip())
+    except ValueError:
+        return None
+
+
+class ParquetSink:
+    """按发布日期分区的Parquet输出：批量组装Arrow记录批次后写入压缩的列式文件
+
+    每次写盘都会在分区目录中新增文件，append=False 时第一次写盘前先删除已有的分区，
+    与覆盖写入的CSV保持一致（否则每次重新运行都会重复全部行）。
+    """
+
+    def __init__(self, root_dir, columns=None, numeric_columns=NUMERIC_COLUMNS,
+                 batch_rows=PARQUET_BATCH_ROWS, compression=PARQUET_COMPRESSION,
+                 categorical_columns=CATEGORICAL_COLUMNS, append=True):
+        if pa is None:
+            raise ImportError("输出Parquet需要安装 pyarrow")
+        self.root_dir = root_dir
+        self.columns = list(columns) if columns else None
+        self.numeric_columns = set(numeric_columns)
+        self.categorical_columns = set(categorical_columns)
+        self.batch_rows = batch_rows
+        self.compression = compression
+        self.append = append
+        self.buffer = []
+        self.count = 0
+        self.marks = []  # [(标记前的累计行数, 标记)]
+        self.schema = None
+
+    def _build_schema(self):
+        if self.columns is None:
+            # 未指定列时取第一批数据中出现过的所有字段，之后保持不变
+            columns = []
+            for row in self.buffer:
+                for key in row:
+                    if key not in columns:
+                        columns.append(key)
+            self.columns = columns
+        def col_type(col):
+            if col in self.numeric_columns:
+                return pa.float64()
+            if col in self.categorical_columns:
+                # 字典编码：每个批次只存一份不同的取值，行中存整数索引
+                return pa.dictionary(pa.int32(), pa.string())
+            return pa.string()
+
+        fields = [pa.field(col, col_type(col)) for col in self.columns if col != PARTITION_COLUMN]
+        fields.append(pa.field(PARTITION_COLUMN, pa.string()))
+        self.schema = pa.schema(fields)
+
+    def _clear(self):
+        """删除根目录下已有的日期分区（只删除本输出写入的分区目录）"""
+        if os.path.isdir(self.root_dir):
+            for name in os.listdir(self.root_dir):
+                if name.startswith(f'{PARTITION_COLUMN}='):
+                    shutil.rmtree(os.path.join(self.root_dir, name))
+        self.append = True
+
+    def _to_batch(self, rows):
+        arrays = []
+        for field in self.schema:
+            col = field.name
+            if col == PARTITION_COLUMN:
+                values = [str(row.get(PARTITION_SOURCE) or '')[:10] or 'unknown' for row in rows]
+            elif col in self.numeric_columns:
+                values = [to_number(row.get(col)) for row in rows]
+            else:
+                values = [None if row.get(col) is None else str(row.get(col)) for row in rows]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def write(self, row):
+        """写入一行（先进入缓冲）"""
+        self.buffer.append(row)
+        if len(self.buffer) >= self.batch_rows:
+            self.flush()
+
+    def write_rows(self, rows):
+        """写入多行"""
+        for row in rows:
+            self.write(row)
+
+    def mark(self, tag):
+        """在当前写入位置做标记（如页码），标记之前的行全部落盘后由 take_flushed 取回
+
+        Parquet跨页缓冲、按批次写盘（避免大量小文件），调用方据此只为已落盘的页面记录检查点。
+        """
+        self.marks.append((self.count + len(self.buffer), tag))
+
+    def take_flushed(self):
+        """取回之前的行都已落盘的标记（按标记顺序）"""
+        done = []
+        while self.marks and self.marks[0][0] <= self.count:
+            done.append(self.marks.pop(0)[1])
+        return done
+
+    def flush(self):
+        """把缓冲转换为记录批次并写入对应的日期分区"""
+        if not self.buffer:
+            return
+        if self.schema is None:
+            self._build_schema()
+        if not self.append:
+            self._clear()
+        table = pa.Table.from_batches([self._to_batch(self.buffer)])
+        pq.write_to_dataset(table, self.root_dir, partition_cols=[PARTITION_COLUMN],
+                            compression=self.compression)
+        self.count += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        """写出剩余缓冲"""
+        self.flush()
+        logger.info(f"已保存 {self.count} 条记录到 {self.root_dir}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SqliteSink:
+    """SQLite输出：以 (公告编号, 批次编号) 为主键批量upsert
+
+    公告出现新版本时原地更新；新版本中已不存在的批次行会被删除。
+    同一公告的所有批次行需要通过一次 write_rows 写入，保证它们落在同一个事务里。
+    """
+
+    def __init__(self, db_path, table='lots', columns=None, key_columns=SQLITE_KEY_COLUMNS,
+                 index_columns=SQLITE_INDEX_COLUMNS, numeric_columns=NUMERIC_COLUMNS,
+                 batch_rows=SQLITE_BATCH_ROWS):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.table = table
+        self.columns = list(columns) if columns else None
+        self.key_columns = list(key_columns)
+        self.index_columns = list(index_columns)
+        self.numeric_columns = set(numeric_columns)
+        self.batch_rows = batch_rows
+        self.buffer = []
+        self.count = 0
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.upsert_sql = None
+
+    def _prepare(self):
+        if self.columns is None:
+            # 未指定列时取第一批数据中出现过的所有字段
+            columns = []
+            for row in self.buffer:
+                for key in row:
+                    if key not in columns:
+                        columns.append(key)
+            self.columns = columns
+        for key in self.key_columns:
+            if key not in self.columns:
+                self.columns.append(key)
+
+        def col_type(col):
+            return 'REAL' if col in self.numeric_columns else 'TEXT'
+
+        col_defs = ', '.join(f'"{col}" {col_type(col)}' for col in self.columns)
+        keys = ', '.join(f'"{col}"' for col in self.key_columns)
+        with self.conn:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" ({col_defs}, PRIMARY KEY ({keys}))')
+            # 已有表缺少的列补上
+            existing = {r[1] for r in self.conn.execute(f'PRAGMA table_info("{self.table}")')}
+            for col in self.columns:
+                if col not in existing:
+                    self.conn.execute(f'ALTER TABLE "{self.table}" ADD COLUMN "{col}" {col_type(col)}')
+            for col in self.index_columns:
+                if col in self.columns:
+                    self.conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{self.table}_{col}" '
+                                      f'ON "{self.table}" ("{col}")')
+
+        names = ', '.join(f'"{col}"' for col in self.columns)
+        marks = ', '.join('?' for _ in self.columns)
+        updates = ', '.join(f'"{col}" = excluded."{col}"' for col in self.columns if col not in self.key_columns)
+        self.upsert_sql = (f'INSERT INTO "{self.table}" ({names}) VALUES ({marks}) '
+                           f'ON CONFLICT ({keys}) DO UPDATE SET {updates}')
+
+    def _values(self, row):
+        values = []
+        for col in self.columns:
+            value = row.get(col)
+            if col in self.key_columns:
+                values.append('' if value is None else str(value))
+            elif col in self.numeric_columns:
+                values.append(to_number(value))
+            else:
+                values.append(None if value is None else str(value))
+        return values
+
+    def write(self, row):
+        """写入一行（先进入缓冲）"""
+        self.write_rows([row])
+
+    def write_rows(self, rows):
+        """写入多行（同一公告的批次行应一起写入）"""
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        """在一个事务里upsert缓冲中的所有行"""
+        if not self.buffer:
+            return
+        if self.upsert_sql is None:
+            self._prepare()
+        notice_col, lot_col = self.key_columns[0], self.key_columns[-1]
+        lots_by_notice = {}
+        rows = []
+        duplicates = []
+        current, seen = None, set()
+        for row in self.buffer:
+            notice, lot = str(row.get(notice_col) or ''), str(row.get(lot_col) or '')
+            if notice != current:
+                # 同一公告的批次行是连续写入的；之后再出现的同一公告视为新版本
+                current, seen = notice, set()
+            if lot in seen:
+                # 同一公告内主键重复：丢弃后面的行，避免upsert悄悄覆盖前面的批次
+                duplicates.append(f"{notice}/{lot}")
+                continue
+            seen.add(lot)
+            rows.append(row)
+            lots_by_notice.setdefault(notice, []).append(lot)
+        if duplicates:
+            logger.error(f"{len(duplicates)} 行与同一公告中的其他批次主键重复，已丢弃: {', '.join(duplicates[:10])}")
+        with self.conn:
+            # 删除新版本中已不存在的批次
+            for notice, lots in lots_by_notice.items():
+                marks = ', '.join('?' for _ in lots)
+                self.conn.execute(f'DELETE FROM "{self.table}" WHERE "{notice_col}" = ? '
+                                  f'AND "{lot_col}" NOT IN ({marks})', [notice] + lots)
+            self.conn.executemany(self.upsert_sql, (self._values(row) for row in rows))
+        self.count += len(rows)
+        self.buffer = []
+
+    def close(self):
+        """写出剩余缓冲并关闭连接"""
+        self.flush()
+        self.conn.close()
+        logger.info(f"已upsert {self.count} 条记录到 {self.db_path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
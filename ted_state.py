@@ -0,0 +1,286 @@
+import os  # 用于文件和目录操作
+import json  # 用于处理JSON数据
+import struct  # 用于定长指纹记录
+import hashlib  # 用于生成查询键和公告指纹
+import threading  # 用于线程同步
+import logging  # 用于日志记录
+from ted_cache import atomic_write  # 用于原子写入状态文件
+
+logger = logging.getLogger("TEDScraper")
+
+# 公告指纹索引记录：公告编号(定长UTF-8) + 指纹
+FINGERPRINT_KEY_SIZE = 20
+FINGERPRINT_SIZE = 8
+FINGERPRINT_RECORD = struct.Struct(f'<{FINGERPRINT_KEY_SIZE}s{FINGERPRINT_SIZE}s')
+
+
+def publication_sort_key(number):
+    """把公告编号（如 123456-2024）转换为可比较的 (年份, 序号)"""
+    try:
+        seq, year = str(number).split('-', 1)
+        return int(year), int(seq)
+    except (ValueError, AttributeError):
+        return 0, 0
+
+
+def query_key(query):
+    """查询语句的短哈希，作为状态文件中的键"""
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()[:16]
+
+
+def load_json(path, default):
+    """读取JSON状态文件，不存在或损坏时返回默认值"""
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"读取状态文件 {path} 失败: {str(e)}")
+        return default
+
+
+def save_json(path, data):
+    """原子写入JSON状态文件"""
+    atomic_write(path, json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+class WatermarkStore:
+    """按查询保存已入库的最大公告编号"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.marks = load_json(path, {})
+
+    def get(self, query):
+        return self.marks.get(query_key(query), {}).get('publication_number')
+
+    def set(self, query, publication_number):
+        with self.lock:
+            self.marks[query_key(query)] = {'query': query, 'publication_number': publication_number}
+            save_json(self.path, self.marks)
+
+
+class IncrementalCrawl:
+    """增量抓取：查询按 publication-number 降序分页，遇到已入库的公告即可停止翻页
+
+    只有本次确实翻到了上次的水位线（或首次运行）才推进水位线，
+    避免页数上限截断时在两次运行之间留下缺口。
+    """
+
+    def __init__(self, store, query):
+        self.store = store
+        self.query = query
+        self.mark = store.get(query)
+        self.highest = None
+        self.reached = False
+        self.complete = True
+        if self.mark:
+            logger.info(f"增量模式: 上次水位线 {self.mark}")
+
+    def new_items(self, items, number_of=lambda notice: notice.get('publication-number')):
+        """返回比水位线新的条目；出现已入库的条目时标记 reached"""
+        return list(self.iter_new(items, number_of))
+
+    def iter_new(self, items, number_of=lambda notice: notice.get('publication-number')):
+        """new_items 的惰性版本，用于流式处理的页面（迭代完后 reached 才确定）"""
+        mark_key = publication_sort_key(self.mark) if self.mark else None
+        for item in items:
+            number = number_of(item)
+            key = publication_sort_key(number)
+            if self.highest is None or key > publication_sort_key(self.highest):
+                self.highest = number
+            if mark_key is not None and key <= mark_key:
+                self.reached = True
+                continue
+            yield item
+
+    def mark_gap(self):
+        """有页面抓取失败被跳过时调用，本次不推进水位线"""
+        self.complete = False
+
+    def finish(self):
+        """抓取结束时推进水位线"""
+        if self.highest is None:
+            return
+        if not self.complete:
+            logger.warning("增量模式: 本次有页面抓取失败，不推进水位线")
+            return
+        if self.mark is None or self.reached:
+            if self.mark is None or publication_sort_key(self.highest) > publication_sort_key(self.mark):
+                self.store.set(self.query, self.highest)
+                logger.info(f"增量模式: 水位线更新为 {self.highest}")
+        else:
+            logger.warning(f"增量模式: 未翻到上次水位线 {self.mark}，本次不推进水位线，请增大页数上限")
+
+
+class CrawlCheckpoint:
+    """抓取检查点日志
+
+    每页数据写入输出后向日志追加一行（页码及该页完成的公告编号）并立即落盘，
+    单行写入保证原子性，中断时写了一半的末行在读取时忽略。
+    崩溃后以 resume=True 重新运行即可跳过已完成的页面和公告；已开始但未完成的
+    页面会重新抓取（降序分页在两次运行之间可能平移，已完成的公告仍按编号跳过）。
+    输出先于检查点落盘，因此恢复后最多重复写入崩溃时那一批数据。抓取正常结束后删除日志。
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.done_pages = set()
+        self.done_notices = set()
+        self.started_pages = set()
+        if resume:
+            self._load()
+            in_flight = sorted(self.started_pages - self.done_pages)
+            logger.info(f"从检查点恢复: 已完成 {len(self.done_pages)} 页、{len(self.done_notices)} 个公告，"
+                        f"重新抓取未完成的页面 {in_flight}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if resume and self.file.tell() > 0 and not self._ends_with_newline():
+            self.file.write('\n')  # 与中断留下的半行隔开
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('event') == 'page_start':
+                    self.started_pages.add(entry['page'])
+                elif entry.get('event') == 'page_done':
+                    self.done_pages.add(entry['page'])
+                    self.done_notices.update(entry.get('ids', []))
+                elif entry.get('event') == 'notices_done':
+                    self.done_notices.update(entry.get('ids', []))
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _append(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def page_done(self, page):
+        return page in self.done_pages
+
+    def notice_done(self, notice_id):
+        return notice_id in self.done_notices
+
+    def start_page(self, page):
+        self.started_pages.add(page)
+        self._append({'event': 'page_start', 'page': page})
+
+    def complete_page(self, page, notice_ids):
+        """页面数据已写入输出（各输出都已落盘）时调用"""
+        notice_ids = [n for n in notice_ids if n]
+        self.done_pages.add(page)
+        self.done_notices.update(notice_ids)
+        self._append({'event': 'page_done', 'page': page, 'ids': notice_ids})
+
+    def complete_notices(self, notice_ids):
+        """只记录已写入输出的公告，页面保持未完成（续爬时重新抓取该页其余公告）"""
+        notice_ids = [n for n in notice_ids if n]
+        if notice_ids:
+            self.done_notices.update(notice_ids)
+            self._append({'event': 'notices_done', 'ids': notice_ids})
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def finish(self):
+        """抓取正常结束：删除检查点日志"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def notice_fingerprint(notice):
+    """公告指纹：版本号 + 原始记录内容的哈希"""
+    version = notice.get('change-notice-version-identifier', '')
+    body = json.dumps(notice, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(f"{version}|{body}".encode('utf-8'), digest_size=FINGERPRINT_SIZE).digest()
+
+
+class ChangeIndex:
+    """公告指纹索引，用于跳过内容未变化的公告
+
+    磁盘上是定长二进制记录 (公告编号, 指纹) 的追加文件，后写入的记录覆盖先前的；
+    关闭时若过期记录过多则重写压缩。公告提取成功后通过 stage 暂存指纹，
+    各输出都落盘后才通过 commit 写入索引；提取失败的公告不会被记为未变化。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.prints = {}
+        self.checked = {}
+        self.pending = {}
+        self.records = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % FINGERPRINT_RECORD.size  # 忽略不完整的末尾记录
+            for key, digest in FINGERPRINT_RECORD.iter_unpack(data[:usable]):
+                self.prints[key.rstrip(b'\0').decode('utf-8')] = digest
+                self.records += 1
+        self.file = open(path, 'ab')
+
+    def changed(self, notice):
+        """新公告或内容有变化时返回 True（指纹先记下，提取成功后由 stage 暂存）"""
+        number = notice.get('publication-number')
+        if not number:
+            return True
+        digest = notice_fingerprint(notice)
+        if self.prints.get(number) == digest:
+            self.skipped += 1
+            return False
+        if len(number.encode('utf-8')) <= FINGERPRINT_KEY_SIZE:
+            self.checked[number] = digest
+        return True
+
+    def stage(self, number):
+        """公告提取成功后调用，其指纹在下次 commit 时写入索引"""
+        digest = self.checked.pop(number, None)
+        if digest is not None:
+            self.pending[number] = digest
+
+    def commit(self, numbers=None):
+        """各输出都落盘后调用，把暂存的指纹写入索引（未暂存的公告下次仍会处理）
+
+        指定 numbers 时只写入这些公告的指纹（其余的等它们所在的页面落盘后再写入）。
+        """
+        with self.lock:
+            if numbers is None:
+                numbers = list(self.pending)
+            for number in numbers:
+                digest = self.pending.pop(number, None)
+                if digest is None:
+                    continue
+                self.prints[number] = digest
+                self.file.write(FINGERPRINT_RECORD.pack(number.encode('utf-8'), digest))
+                self.records += 1
+            self.checked = {}
+            self.file.flush()
+
+    def close(self):
+        """关闭索引，过期记录超过一半时重写文件"""
+        with self.lock:
+            self.file.close()
+            if self.records > 2 * len(self.prints):
+                data = b''.join(FINGERPRINT_RECORD.pack(k.encode('utf-8'), v) for k, v in self.prints.items())
+                atomic_write(self.path, data)
+        logger.info(f"变更检测: 跳过 {self.skipped} 个未变化的公告")
@@ -0,0 +1,93 @@
+import time  # 用于计时
+import logging  # 用于日志记录
+import numpy as np  # 用于批次行的广播索引
+import pandas as pd  # 用于列式批量提取
+
+logger = logging.getLogger("TEDScraper")
+
+
+def field_columns(notices, fields):
+    """按API字段取出各列的值列表（缺失的字段为 None）"""
+    return {field: [notice.get(field) for notice in notices] for field in fields}
+
+
+def explode(values, empty=None):
+    """用 pandas 的列表展开（Series.explode）把列表列展开成每个元素一行
+
+    返回 (所属行的位置, 元素在所属列表中的位置, 元素列表)；空列表或非列表的值展开后
+    对应一行 empty，元素位置为 -1。
+    """
+    series = pd.Series(values, dtype=object)
+    missing = ~series.map(lambda v: isinstance(v, list) and len(v) > 0).to_numpy(dtype=bool)
+    exploded = series.where(~missing, None).explode()
+    index = exploded.index.to_numpy()
+    offsets = exploded.groupby(level=0, sort=False).cumcount().to_numpy().copy()
+    offsets[missing[index]] = -1
+    items = exploded.tolist()
+    for i in np.flatnonzero(offsets < 0):
+        items[i] = {} if empty is None else empty
+    return index, offsets, items
+
+
+def broadcast(columns, index):
+    """把公告级的列按展开后的位置广播到批次行（整列按位置取值，不复制字典）"""
+    frame = pd.DataFrame(columns, dtype=object)
+    return frame.take(index).reset_index(drop=True)
+
+
+def pluck(values, key, default=''):
+    """字典列按键取值，非字典的元素取 default"""
+    return [v.get(key, default) if isinstance(v, dict) else default for v in values]
+
+
+def first_of(values):
+    """非空元素取第一个（列表取 [0]，其他原样），空值为 None"""
+    return [(v[0] if isinstance(v, list) else v) if v else None for v in values]
+
+
+def categorize(table, columns):
+    """把取值重复度高的列转成 pandas 分类类型（每个取值只存一份，行中存整数编码）"""
+    for col in columns:
+        if col in table:
+            try:
+                table[col] = table[col].astype('category')
+            except TypeError:
+                pass  # 含有列表等不可哈希的值时保持 object
+    return table
+
+
+def rows_frame(rows, columns):
+    """逐行提取的行（LotRow 或字典）转换成表，与 save_data 写出前的转换相同"""
+    return pd.DataFrame([[row.get(col) for col in columns] for row in rows], columns=columns, dtype=object)
+
+
+def check_table(table, rows, columns):
+    """比较批量提取的表与逐行提取的结果（行列表或 rows_frame 的表），返回不一致的列名列表"""
+    expected = rows if isinstance(rows, pd.DataFrame) else rows_frame(rows, columns)
+    expected = expected.reset_index(drop=True)
+    actual = table[columns].astype(object).reset_index(drop=True)
+    if len(expected) != len(actual):
+        logger.error(f"行数不一致: 逐行 {len(expected)}，批量 {len(actual)}")
+        return list(columns)
+    return [col for col in columns if not expected[col].equals(actual[col])]
+
+
+def compare_extraction(notices, row_func, table_func, columns):
+    """对同一批公告分别逐行提取和批量提取，记录耗时并检查结果是否一致
+
+    逐行的耗时包括把行转换成表（两条路径都以得到可写出的表为止计时）。
+    """
+    notices = list(notices)
+    start = time.perf_counter()
+    rows = rows_frame([row for notice in notices for row in row_func(notice)], columns)
+    row_time = time.perf_counter() - start
+    start = time.perf_counter()
+    table = table_func(notices)
+    table_time = time.perf_counter() - start
+    mismatched = check_table(table, rows, columns)
+    logger.info(f"{len(notices)} 个公告 / {len(rows)} 行: 逐行 {row_time:.3f} 秒，批量 {table_time:.3f} 秒")
+    if mismatched:
+        logger.error(f"批量提取与逐行提取不一致的列: {', '.join(mismatched)}")
+    else:
+        logger.info("批量提取与逐行提取结果一致")
+    return not mismatched